@@ -1 +1,6 @@
-from .main import create_app 
\ No newline at end of file
+def __getattr__(name):
+    # 延迟导入 Flask 应用，使 tovideo.py 等脚本可以只导入 app.vtt
+    if name == 'create_app':
+        from .main import create_app
+        return create_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,252 @@
+"""
+Production ASGI entry point: uvicorn app.asgi:app
+
+The Flask app is served through a small WSGI-to-ASGI bridge. The event loop
+only accepts connections and moves bytes; every request runs in the bounded
+thread pool of its lane:
+
+    io       subtitles, channels, batches, jobs, metrics: threads that mostly
+             wait on yt-dlp, HTTP and ffmpeg (Config.ASGI_IO_WORKERS)
+    whisper  synchronous and streamed Whisper requests (Config.ASGI_WHISPER_WORKERS);
+             the threads download the audio and wait while the transcription runs
+             in the Whisper process pool, which is forked here at startup
+             (Config.WHISPER_PROCESS_WORKERS, or Config.ASGI_WHISPER_PROCESS_WORKERS)
+
+A lane admits at most its workers plus its queue limit; requests beyond that
+are answered with 503 and Retry-After without touching the app, so a burst of
+slow lookups cannot exhaust threads or memory. Transcriptions beyond the
+process pool's limit get 429.
+
+Whisper job workers are not started by the uvicorn workers (unless
+Config.ASGI_START_JOB_WORKERS is set); run them once with `python -m app.worker`.
+"""
+import asyncio
+import io
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from .config import config
+from .main import create_app
+from .metrics import registry, Counter, Gauge
+from .services.audio_service import whisper_processes
+
+lane_admitted = registry.register(Gauge(
+    'yt_tools_asgi_lane_requests', 'Requests admitted to each ASGI lane, running or queued', ('lane',)))
+lane_rejected = registry.register(Counter(
+    'yt_tools_asgi_rejected_total', 'Requests rejected with 503 because the lane was full', ('lane',)))
+
+# 按路径前缀选择执行线程池，未列出的路径使用 io
+LANE_PREFIXES = (
+    ('/api/whisper/subtitles', 'whisper'),
+)
+
+
+class RequestBodyTooLarge(Exception):
+    pass
+
+
+class Lane:
+    """Bounded thread pool with an admission limit of workers + queue requests"""
+
+    def __init__(self, name: str, workers: int, queue: int):
+        self.name = name
+        self.limit = workers + queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'asgi-{name}')
+        self._admitted = 0
+
+    # 以下两个方法只在事件循环线程中调用，无需加锁
+    def try_acquire(self) -> bool:
+        if self._admitted >= self.limit:
+            lane_rejected.inc(self.name)
+            return False
+        self._admitted += 1
+        lane_admitted.inc(self.name)
+        return True
+
+    def release(self) -> None:
+        self._admitted -= 1
+        lane_admitted.dec(self.name)
+
+
+def build_environ(scope: Dict, body: bytes) -> Dict:
+    """Translate an ASGI HTTP scope and its request body into a WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class WSGIBridge:
+    """ASGI application running a WSGI app in per-lane bounded thread pools"""
+
+    def __init__(self, wsgi_app: Callable, lanes: Dict[str, Lane],
+                 prefixes: Tuple[Tuple[str, str], ...] = LANE_PREFIXES, default_lane: str = 'io'):
+        self.wsgi_app = wsgi_app
+        self.lanes = lanes
+        self.prefixes = prefixes
+        self.default_lane = default_lane
+
+    def lane_for(self, path: str) -> Lane:
+        for prefix, name in self.prefixes:
+            if path.startswith(prefix):
+                return self.lanes[name]
+        return self.lanes[self.default_lane]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        lane = self.lane_for(scope['path'])
+        if not lane.try_acquire():
+            return await self.reject(send, 503, f"Server busy: too many requests queued ({lane.name})")
+        try:
+            try:
+                body = await self.read_body(receive)
+            except RequestBodyTooLarge:
+                return await self.reject(send, 413, f"Request body larger than {config.ASGI_MAX_BODY} bytes")
+            if body is None:
+                return
+
+            loop = asyncio.get_running_loop()
+            disconnected = threading.Event()
+            watcher = loop.create_task(self.watch_disconnect(receive, disconnected))
+            try:
+                await loop.run_in_executor(
+                    lane.executor, self.run_wsgi, build_environ(scope, body), send, loop, disconnected
+                )
+            finally:
+                watcher.cancel()
+        finally:
+            lane.release()
+
+    @staticmethod
+    async def read_body(receive) -> Optional[bytes]:
+        """Read the whole request body; None if the client disconnected first"""
+        chunks: List[bytes] = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > config.ASGI_MAX_BODY:
+                raise RequestBodyTooLarge()
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    async def watch_disconnect(receive, disconnected: threading.Event) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    def run_wsgi(self, environ: Dict, send, loop, disconnected: threading.Event) -> None:
+        """Run the WSGI app in a lane thread, forwarding the response through the event loop"""
+        def send_sync(message):
+            # 等待发送完成，慢速客户端会反压到生成响应的线程
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {'started': False}
+
+        def send_start():
+            if not response['started']:
+                response['started'] = True
+                send_sync({'type': 'http.response.start', 'status': response['status'],
+                           'headers': response['headers']})
+
+        def write(data):
+            # 旧式 WSGI 应用通过 write() 输出的数据直接作为响应体发出
+            send_start()
+            if data:
+                send_sync({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response['started']:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return write
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            # 响应头先行发出，流式响应的客户端可以立即开始读取
+            send_start()
+            for chunk in iterable:
+                # 客户端断开后停止生成，流式转写等工作随之结束
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    send_start()
+                    send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_sync({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    @staticmethod
+    async def reject(send, status: int, error: str) -> None:
+        body = json.dumps({'status': 'error', 'error': error}).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            (b'retry-after', str(config.RETRY_AFTER).encode('latin-1')),
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for lane in self.lanes.values():
+                    lane.executor.shutdown(wait=False)
+                whisper_processes.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+wsgi_app = create_app(start_job_workers=config.ASGI_START_JOB_WORKERS)
+# 转写进程在模型预加载之后、请求线程启动之前 fork
+whisper_processes.start(config.WHISPER_PROCESS_WORKERS or config.ASGI_WHISPER_PROCESS_WORKERS)
+
+app = WSGIBridge(wsgi_app, {
+    'io': Lane('io', config.ASGI_IO_WORKERS, config.ASGI_IO_QUEUE),
+    'whisper': Lane('whisper', config.ASGI_WHISPER_WORKERS, config.ASGI_WHISPER_QUEUE),
+})
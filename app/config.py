@@ -1,3 +1,5 @@
+import os
+import tempfile
 from dataclasses import dataclass
 
 @dataclass
@@ -5,5 +7,91 @@ class Config:
     YOUTUBE_BASE_URL = "https://www.youtube.com"
     DEFAULT_LANGUAGE = "en"
     MAX_PLAYLIST_ITEMS = 10000
+    LOG_LEVEL = "INFO"
 
-config = Config() 
\ No newline at end of file
+    # 频道视频索引
+    CHANNEL_INDEX_PATH = os.path.join(tempfile.gettempdir(), 'yt-tools-channels.sqlite')
+    CHANNEL_SYNC_INTERVAL = 10 * 60  # 秒，两次增量同步的最小间隔
+    CHANNEL_SYNC_PLAYLISTS = True  # 增量同步时也检查频道的播放列表
+    PLAYLIST_CRAWL_WORKERS = 4
+    PLAYLIST_CACHE_TTL = 24 * 3600  # 秒，播放列表未报告视频数时缓存的有效期
+
+    # 字幕缓存
+    SUBTITLE_CACHE_TTL = 6 * 3600  # 秒
+    SUBTITLE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    SUBTITLE_CACHE_STORE = None  # None, 'sqlite' 或 'file'
+    SUBTITLE_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'yt-tools-subtitles.sqlite')
+    SUBTITLE_CACHE_SWEEP_INTERVAL = 10 * 60  # 秒，定期删除持久化存储中的过期条目
+
+    # 字幕轨道下载：同一视频的多个语言并行下载，格式按顺序尝试，非 VTT 格式在本地转换
+    SUBTITLE_TRACK_WORKERS = 8
+    SUBTITLE_MANUAL_FORMATS = ('vtt', 'json3', 'srv3')
+    SUBTITLE_AUTO_FORMATS = ('json3', 'srv3', 'vtt')  # 自动字幕的 json3 不含滚动重复的行和逐词标签，比 VTT 小数倍
+
+    # yt-dlp 实例池与 cookies
+    YTDLP_COOKIES_BROWSER = "firefox"  # None 表示不使用浏览器 cookies
+    COOKIE_REFRESH_INTERVAL = 30 * 60  # 秒
+    COOKIE_DOMAINS = ('youtube.com', 'google.com', 'googlevideo.com')
+    YTDLP_POOL_MAX_IDLE = 8  # 每种配置保留的空闲实例数
+    HTTP_POOL_MAXSIZE = 16
+    HTTP_TIMEOUT = 30  # 秒
+
+    # 批量字幕与外部请求限速
+    BATCH_MAX_WORKERS = 8
+    BATCH_MAX_VIDEOS = 5000
+    HOST_MAX_CONCURRENCY = 4  # 每个域名的最大并发请求数
+    HOST_RATE_LIMIT = 5.0  # 每个域名每秒请求数，0 表示不限速
+    HOST_RATE_BURST = 10
+
+    # Whisper 模型
+    WHISPER_MODEL_SIZE = "large"  # tiny, base, small, medium, large
+    WHISPER_DEVICE = "cpu"
+    WHISPER_MODEL_IDLE_TIMEOUT = 600  # 秒，0 表示不卸载
+    WHISPER_PRELOAD_MODELS = ()  # 启动时加载并常驻的模型，fork 出的进程共享权重
+    WHISPER_WORD_TIMESTAMPS = False  # 在转写结果中保存逐词时间戳
+
+    # 语音识别后端：whisper（openai-whisper，PyTorch）或 ctranslate2（faster-whisper，量化权重）
+    ASR_BACKEND = "whisper"
+    ASR_COMPUTE_TYPE = "int8"  # ctranslate2 计算类型：int8、int8_float32、float32 等
+    ASR_CPU_THREADS = 0  # ctranslate2 每个模型使用的线程数，0 表示由 CTranslate2 决定
+    ASR_BATCH_SIZE = 8  # ctranslate2 一次前向计算最多合并的音频窗口数
+    ASR_BATCH_WAIT = 0.05  # 秒，等待其他转写的窗口凑成一批的最长时间；只有一个转写在进行时不等待
+
+    # Whisper 转写结果持久化，按视频、模型、语言和解码参数保存原始片段
+    WHISPER_TRANSCRIPT_DB_PATH = os.path.join(tempfile.gettempdir(), 'yt-tools-whisper-transcripts.sqlite')
+
+    # Whisper 流式转写：按窗口切分音频，窗口末尾在静音处切开
+    WHISPER_STREAM_WINDOW = 30.0  # 秒
+    WHISPER_STREAM_SILENCE_SEARCH = 5.0  # 秒
+    WHISPER_STREAM_OVERLAP = 1.0  # 秒，相邻窗口重叠的长度，切点落在词中时由另一窗口完整识别
+
+    # Whisper 异步任务
+    WHISPER_JOB_WORKERS = 2  # 工作进程数，每个进程加载一份模型
+    WHISPER_JOB_THREADS = 0  # 每个工作进程同时处理的任务数，0 表示 ctranslate2 后端为 ASR_BATCH_SIZE（这些任务的窗口合并解码），whisper 后端为 1
+    WHISPER_JOB_DB_PATH = os.path.join(tempfile.gettempdir(), 'yt-tools-whisper-jobs.sqlite')
+    WHISPER_JOB_POLL_INTERVAL = 1.0  # 秒
+    WHISPER_JOB_HEARTBEAT_INTERVAL = 15  # 秒，工作进程续租其运行中任务的间隔
+    WHISPER_JOB_LEASE = 90  # 秒，超过该时间未续租的运行中任务重新排队
+
+    # 相同请求合并：等待进行中的相同请求的最长时间
+    SUBTITLE_FLIGHT_TIMEOUT = 120  # 秒
+    WHISPER_FLIGHT_TIMEOUT = 3 * 3600  # 秒
+
+    # 生产部署（uvicorn app.asgi:app）：阻塞的请求在有界线程池中执行，队列满时拒绝新请求
+    ASGI_IO_WORKERS = 512  # 字幕、频道等请求的线程数，线程大多在等待 yt-dlp、HTTP 和 ffmpeg
+    ASGI_IO_QUEUE = 2048  # 线程全忙时最多排队的请求数，超出返回 503
+    ASGI_WHISPER_WORKERS = 16  # 同步和流式 Whisper 请求的线程数
+    ASGI_WHISPER_QUEUE = 64
+    ASGI_WHISPER_PROCESS_WORKERS = 2  # WHISPER_PROCESS_WORKERS 为 0 时生产部署使用的转写进程数
+    ASGI_START_JOB_WORKERS = False  # 为 True 时每个 uvicorn 工作进程各自启动任务工作进程，默认由 python -m app.worker 单独启动
+    ASGI_MAX_BODY = 10 * 1024 * 1024  # 字节，请求体上限
+    RETRY_AFTER = 5  # 秒，503 和 429 响应的 Retry-After
+
+    # 同步和流式 Whisper 请求的转写进程，0 表示开发服务器在请求线程中转写（生产部署使用 ASGI_WHISPER_PROCESS_WORKERS）
+    WHISPER_PROCESS_WORKERS = 0
+    WHISPER_PROCESS_QUEUE = 8  # 等待转写进程的视频数上限，超出返回 429；与进程数之和应小于 ASGI_WHISPER_WORKERS
+
+    # 指标
+    PROFILE_HEADER = "X-Profile"  # 请求带有该头时，响应的 Server-Timing 头给出各阶段耗时
+
+config = Config()
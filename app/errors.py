@@ -1,5 +1,7 @@
 from functools import wraps
 from flask import jsonify
+from .config import config
+from .metrics import api_errors
 
 class YouTubeAPIError(Exception):
     """Base exception for YouTube API related errors"""
@@ -9,10 +11,18 @@ class InvalidParameterError(YouTubeAPIError):
     """Exception raised for invalid parameters"""
     pass
 
+class NotFoundError(YouTubeAPIError):
+    """Exception raised when a requested resource does not exist"""
+    pass
+
 class YouTubeServiceError(YouTubeAPIError):
     """Exception raised for YouTube service errors"""
     pass
 
+class TooManyRequestsError(YouTubeAPIError):
+    """Exception raised when a bounded work queue is full and the client should retry later"""
+    pass
+
 def handle_api_error(f):
     """Decorator to handle API errors and return appropriate responses"""
     @wraps(f)
@@ -20,16 +30,31 @@ def handle_api_error(f):
         try:
             return f(*args, **kwargs)
         except InvalidParameterError as e:
+            api_errors.inc(type(e).__name__)
             return jsonify({
                 'status': 'error',
                 'error': str(e)
             }), 400
+        except NotFoundError as e:
+            api_errors.inc(type(e).__name__)
+            return jsonify({
+                'status': 'error',
+                'error': str(e)
+            }), 404
+        except TooManyRequestsError as e:
+            api_errors.inc(type(e).__name__)
+            return jsonify({
+                'status': 'error',
+                'error': str(e)
+            }), 429, {'Retry-After': str(config.RETRY_AFTER)}
         except YouTubeServiceError as e:
+            api_errors.inc(type(e).__name__)
             return jsonify({
                 'status': 'error',
                 'error': str(e)
             }), 500
         except Exception as e:
+            api_errors.inc(type(e).__name__)
             return jsonify({
                 'status': 'error',
                 'error': f"Unexpected error: {str(e)}"
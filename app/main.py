@@ -1,14 +1,64 @@
-from flask import Flask
-from .routes.api import get_channel_videos, get_subtitles, get_whisper_subtitles
+import logging
+import time
+from flask import Flask, g, request
+from .routes.api import (
+    get_channel_videos, get_subtitles, get_subtitles_batch, get_whisper_subtitles, get_subtitle_cache_stats,
+    stream_whisper_subtitles, create_whisper_job, get_whisper_job, get_metrics
+)
+from .config import config
+from . import metrics
+from .services.job_service import whisper_jobs
+from .services.model_registry import model_registry
 
-def create_app():
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.requests_in_flight.inc()
+    if request.headers.get(config.PROFILE_HEADER):
+        metrics.start_profile()
+
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.request_seconds.observe(elapsed, endpoint)
+    metrics.requests_total.inc(endpoint, str(response.status_code))
+
+    # 流式响应在响应头发出之后才完成的阶段不包含在内
+    profile = metrics.stop_profile()
+    if profile is not None:
+        response.headers['Server-Timing'] = metrics.server_timing(profile + [('total', elapsed)])
+    return response
+
+def end_request_metrics(exc):
+    metrics.requests_in_flight.dec()
+
+def create_app(start_job_workers: bool = True):
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     app = Flask(__name__)
     
     # Register routes
     app.route('/api/channel/videos', methods=['GET'])(get_channel_videos)
     app.route('/api/subtitles', methods=['GET'])(get_subtitles)
+    app.route('/api/subtitles/batch', methods=['POST'])(get_subtitles_batch)
+    app.route('/api/subtitles/cache/stats', methods=['GET'])(get_subtitle_cache_stats)
     app.route('/api/whisper/subtitles', methods=['GET'])(get_whisper_subtitles)
-    
+    app.route('/api/whisper/subtitles/stream', methods=['GET'])(stream_whisper_subtitles)
+    app.route('/api/whisper/jobs', methods=['POST'])(create_whisper_job)
+    app.route('/api/whisper/jobs/<job_id>', methods=['GET'])(get_whisper_job)
+    app.route('/metrics', methods=['GET'])(get_metrics)
+
+    # 请求耗时、状态码和按需的阶段分解
+    app.before_request(start_request_metrics)
+    app.after_request(record_request_metrics)
+    app.teardown_request(end_request_metrics)
+
+    # 常驻模型在 fork 工作进程之前加载，以便共享权重
+    if config.WHISPER_PRELOAD_MODELS:
+        model_registry.preload(config.WHISPER_PRELOAD_MODELS)
+
+    # 启动 Whisper 任务工作进程；生产部署中由 python -m app.worker 单独启动
+    if start_job_workers:
+        whisper_jobs.start()
+
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,206 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Services wrap their stages in `span(stage)`, which records the duration in the
+`yt_tools_stage_seconds` histogram and, when the current request opted in to
+profiling, in that request's stage breakdown. Values are kept per process:
+Whisper job workers and separate gunicorn workers each keep their own.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# 覆盖从毫秒级缓存命中到长视频转写（数分钟）的耗时
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # 无标签的指标从 0 开始输出
+        self._values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # 每组标签：各桶计数（非累计）、总和、次数
+        self._values: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(float(bound))}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+                label_text = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Callback:
+    """Metric whose value is read from a function at scrape time (e.g. cache or job-queue state)"""
+
+    def __init__(self, name: str, help: str, type: str, fn: Callable[[], Union[float, Dict[str, float]]],
+                 labelname: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.fn = fn
+        self.labelname = labelname
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        value = self.fn()
+        if isinstance(value, dict):
+            for label, item in sorted(value.items()):
+                lines.append(f"{self.name}{_format_labels((self.labelname,), (label,))} {_format_value(item)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric; registering a name again replaces the earlier metric"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # 某个回调失败时仍输出其余指标
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    'yt_tools_stage_seconds', 'Duration of instrumented service stages', ('stage',)))
+stage_errors = registry.register(Counter(
+    'yt_tools_stage_errors_total', 'Service stages that raised an exception', ('stage',)))
+request_seconds = registry.register(Histogram(
+    'yt_tools_http_request_seconds', 'HTTP request duration until the response is returned', ('endpoint',)))
+requests_total = registry.register(Counter(
+    'yt_tools_http_requests_total', 'HTTP requests by endpoint and status', ('endpoint', 'status')))
+requests_in_flight = registry.register(Gauge(
+    'yt_tools_http_requests_in_flight', 'HTTP requests currently being handled'))
+api_errors = registry.register(Counter(
+    'yt_tools_api_errors_total', 'Errors returned by API handlers, by exception type', ('type',)))
+
+_profile: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('yt_tools_profile', default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a service stage and record it in the stage histogram and the active profile"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage)
+        profile = _profile.get()
+        if profile is not None:
+            profile.append((stage, elapsed))
+
+
+def start_profile() -> None:
+    """Start collecting a stage breakdown for the current request"""
+    _profile.set([])
+
+
+def stop_profile() -> Optional[List[Tuple[str, float]]]:
+    """Stop collecting and return the (stage, seconds) spans recorded since start_profile"""
+    profile = _profile.get()
+    _profile.set(None)
+    return profile
+
+
+def server_timing(profile: List[Tuple[str, float]]) -> str:
+    """Format a stage breakdown as a Server-Timing header, summing repeated stages"""
+    totals: Dict[str, List[float]] = {}
+    for stage, elapsed in profile:
+        entry = totals.setdefault(stage, [0.0, 0])
+        entry[0] += elapsed
+        entry[1] += 1
+    return ', '.join(
+        f'{stage};dur={total * 1000:.1f};desc="{count}x"' for stage, (total, count) in totals.items()
+    )
@@ -1,30 +1,89 @@
-from flask import request, jsonify, Response
+import json
+from flask import request, jsonify, Response, stream_with_context
 from ..services.channel_service import YouTubeChannelService
 from ..services.subtitle_service import YouTubeSubtitleService
-from ..services.audio_service import YouTubeAudioService
-from ..errors import handle_api_error, InvalidParameterError
+from ..services.audio_service import YouTubeAudioService, whisper_processes
+from ..services.batch_service import SubtitleBatchService
+from ..services.cache_service import subtitle_cache
+from ..services.job_service import whisper_jobs
+from ..services.model_registry import model_registry
+from ..services.transcript_store import (
+    TRANSCRIPT_FORMATS, decoding_options, render_transcript, transcript_store
+)
+from ..config import config
+from ..errors import handle_api_error, InvalidParameterError, NotFoundError
+from .. import metrics
 
 # 初始化服务
 audio_service = YouTubeAudioService()
 
+# 以下指标在抓取 /metrics 时从服务状态读取
+metrics.registry.register(metrics.Callback(
+    'yt_tools_subtitle_cache_hits_total', 'Subtitle cache hits', 'counter',
+    lambda: subtitle_cache.stats()['hits']))
+metrics.registry.register(metrics.Callback(
+    'yt_tools_subtitle_cache_misses_total', 'Subtitle cache misses', 'counter',
+    lambda: subtitle_cache.stats()['misses']))
+metrics.registry.register(metrics.Callback(
+    'yt_tools_subtitle_cache_bytes', 'Bytes held by the in-memory subtitle cache', 'gauge',
+    lambda: subtitle_cache.stats()['bytes']))
+metrics.registry.register(metrics.Callback(
+    'yt_tools_whisper_jobs', 'Whisper jobs by status', 'gauge',
+    whisper_jobs.store.count_by_status, 'status'))
+metrics.registry.register(metrics.Callback(
+    'yt_tools_whisper_models_loaded', 'Whisper models loaded in this process', 'gauge',
+    lambda: len(model_registry.loaded())))
+metrics.registry.register(metrics.Callback(
+    'yt_tools_whisper_process_admitted', 'Videos downloading or waiting for the Whisper process pool', 'gauge',
+    whisper_processes.admitted))
+
+def parse_number_arg(name, cast, default=None):
+    """Parse a numeric query parameter, raising InvalidParameterError on bad input"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = cast(value)
+    except ValueError:
+        raise InvalidParameterError(f'Invalid value for parameter {name}: {value}')
+    if number < 0:
+        raise InvalidParameterError(f'Parameter {name} must not be negative')
+    return number
+
 @handle_api_error
 def get_channel_videos():
     """
-    API endpoint to get all videos from a YouTube channel
+    API endpoint to get videos of a YouTube channel from the channel index
     Query parameters:
         channel_id: YouTube channel ID (required)
+        since: Only videos first seen after this Unix timestamp (optional)
+        offset: Number of videos to skip (default: 0)
+        limit: Maximum number of videos to return (optional)
+        sync: 'auto', 'delta', 'full' or 'none' (default: 'auto')
     """
     channel_id = request.args.get('channel_id')
     
     if not channel_id:
         raise InvalidParameterError('Missing required parameter: channel_id')
-    
-    video_ids = YouTubeChannelService.get_all_videos(channel_id)
-    return jsonify({
-        'status': 'success',
-        'count': len(video_ids),
-        'videos': video_ids
-    })
+
+    since = parse_number_arg('since', float)
+    offset = parse_number_arg('offset', int, 0)
+    limit = parse_number_arg('limit', int)
+    sync = request.args.get('sync', 'auto')
+
+    result = YouTubeChannelService.list_videos(channel_id, since, offset, limit, sync)
+
+    # 逐个输出视频 ID，不在内存中构建完整列表
+    def generate():
+        yield '{"status": "success", "total": %d, "sync": %s, "videos": [' % (
+            result['total'], json.dumps(result['sync']))
+        count = 0
+        for video_id in result['videos']:
+            yield (', ' if count else '') + json.dumps(video_id)
+            count += 1
+        yield '], "count": %d}' % count
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @handle_api_error
 def get_subtitles():
@@ -32,22 +91,79 @@ def get_subtitles():
     API endpoint to get subtitles for a YouTube video
     Query parameters:
         video_id: YouTube video ID (required)
-        lang: Language code (default: 'en')
+        lang: Language code, comma separated codes (or repeated lang), or 'all' (default: 'en')
         pure_text: Whether to return only pure text (default: false)
+        translate: Whether YouTube's auto-translated captions may be used (default: true)
     """
     video_id = request.args.get('video_id')
-    lang = request.args.get('lang', 'en')
+    langs = request.args.getlist('lang') or ['en']
     pure_text = request.args.get('pure_text', 'false').lower() == 'true'
+    translate = request.args.get('translate', 'true').lower() == 'true'
     
     if not video_id:
         raise InvalidParameterError('Missing required parameter: video_id')
 
-    result = YouTubeSubtitleService.capture_subtitles(video_id, lang, pure_text)
+    result = YouTubeSubtitleService.capture_subtitles(video_id, langs, pure_text, translate)
     return jsonify({
         'status': 'success',
         'data': result
     })
 
+@handle_api_error
+def get_subtitles_batch():
+    """
+    API endpoint to get subtitles for many YouTube videos, streamed as NDJSON
+    Body parameters (JSON):
+        video_ids: List of YouTube video IDs (required unless channel_id is given)
+        channel_id: YouTube channel ID whose videos are fetched (optional)
+        langs: List of language codes, or 'all' (default: ['en'])
+        pure_text: Whether to return only pure text (default: false)
+        translate: Whether YouTube's auto-translated captions may be used (default: true)
+    """
+    params = request.get_json(silent=True) or {}
+    video_ids = params.get('video_ids')
+    channel_id = params.get('channel_id')
+    langs = params.get('langs') or [config.DEFAULT_LANGUAGE]
+    pure_text = bool(params.get('pure_text', False))
+    translate = bool(params.get('translate', True))
+
+    if not video_ids and not channel_id:
+        raise InvalidParameterError('Missing required parameter: video_ids or channel_id')
+    if video_ids is not None and not isinstance(video_ids, list):
+        raise InvalidParameterError('video_ids must be a list')
+    if not isinstance(langs, list) and langs != 'all':
+        raise InvalidParameterError("langs must be a list or 'all'")
+
+    if not video_ids:
+        video_ids = list(YouTubeChannelService.list_videos(channel_id)['videos'])
+
+    # 保持顺序去重
+    video_ids = list(dict.fromkeys(video_ids))
+    if len(video_ids) > config.BATCH_MAX_VIDEOS:
+        raise InvalidParameterError(f'Too many videos: {len(video_ids)} > {config.BATCH_MAX_VIDEOS}')
+
+    def generate():
+        succeeded = failed = 0
+        for item in SubtitleBatchService.iter_results(video_ids, langs, pure_text, translate):
+            if item['status'] == 'success':
+                succeeded += 1
+            else:
+                failed += 1
+            yield json.dumps(item) + '\n'
+        yield json.dumps({'status': 'done', 'succeeded': succeeded, 'failed': failed}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@handle_api_error
+def get_subtitle_cache_stats():
+    """
+    API endpoint to get hit/miss statistics of the subtitle cache
+    """
+    return jsonify({
+        'status': 'success',
+        'data': subtitle_cache.stats()
+    })
+
 @handle_api_error
 def get_whisper_subtitles():
     """
@@ -55,21 +171,149 @@ def get_whisper_subtitles():
     Query parameters:
         video_id: YouTube video ID (required)
         lang: Language code (optional, e.g., 'en', 'zh')
+        model: Whisper model size (optional, e.g., 'base', 'large')
+        format: 'vtt', 'srt', 'json' (segments) or 'text' (default: 'vtt')
     """
     video_id = request.args.get('video_id')
     lang = request.args.get('lang')
+    output_format = request.args.get('format', 'vtt')
     
     if not video_id:
         raise InvalidParameterError('Missing required parameter: video_id')
+    if output_format not in TRANSCRIPT_FORMATS:
+        raise InvalidParameterError(f'Unsupported format: {output_format}')
 
-    # 下载音频
-    audio_path = audio_service.download_audio(video_id)
-    
-    # 生成字幕
-    vtt_content = audio_service.generate_subtitles(audio_path, lang)
+    model = model_registry.resolve_size(request.args.get('model'))
+
+    # 已保存的转写结果直接返回；否则下载音频并转写，相同的并发请求共享一次转写
+    transcript = audio_service.transcribe_video(video_id, lang, model)
     
-    # 返回 VTT 内容
     return jsonify({
         'status': 'success',
-        'data': vtt_content
-    }) 
\ No newline at end of file
+        'data': render_transcript(transcript['segments'], output_format),
+        'format': output_format,
+        'language': transcript['language'],
+        'cached': transcript['cached']
+    }) 
+
+@handle_api_error
+def stream_whisper_subtitles():
+    """
+    API endpoint to stream Whisper subtitles while the audio is being transcribed
+    Query parameters:
+        video_id: YouTube video ID (required)
+        lang: Language code (optional, e.g., 'en', 'zh')
+        model: Whisper model size (optional, e.g., 'base', 'large')
+        format: 'sse' for Server-Sent Events or 'vtt' for chunked text/vtt (default: 'sse')
+    """
+    video_id = request.args.get('video_id')
+    lang = request.args.get('lang')
+    output_format = request.args.get('format', 'sse')
+
+    if not video_id:
+        raise InvalidParameterError('Missing required parameter: video_id')
+    if output_format not in ('sse', 'vtt'):
+        raise InvalidParameterError(f'Unsupported format: {output_format}')
+
+    model = model_registry.resolve_size(request.args.get('model'))
+    # 已保存的转写结果不再下载音频，直接按原格式输出
+    stored = transcript_store.find(video_id, model, lang, (decoding_options(), decoding_options(windowed=True)))
+    audio_path = None
+    if not stored:
+        # 转写进程已满时返回 429；名额从下载开始占用，直到响应关闭
+        whisper_processes.acquire()
+        try:
+            audio_path = audio_service.download_audio(video_id)
+        except Exception:
+            whisper_processes.release()
+            raise
+
+    def generate():
+        count = 0
+        collected = []
+        info = {'language': stored['detected_language'] if stored else lang}
+        try:
+            if output_format == 'vtt':
+                yield "WEBVTT\n\n"
+            if stored:
+                segments = stored['segments']
+            else:
+                segments = audio_service.stream_segments(audio_path, lang, model, info)
+            for count, segment in enumerate(segments, 1):
+                collected.append(segment)
+                if output_format == 'vtt':
+                    yield audio_service.format_cue(count, segment)
+                else:
+                    yield f"event: cue\ndata: {json.dumps(dict(segment, index=count))}\n\n"
+            if not stored:
+                transcript_store.put(video_id, model, lang, decoding_options(windowed=True),
+                                     collected, info['language'])
+            if output_format == 'sse':
+                done = {'video_id': video_id, 'segments': count, 'language': info['language'],
+                        'cached': bool(stored)}
+                yield f"event: done\ndata: {json.dumps(done)}\n\n"
+        except Exception as e:
+            # 响应头已发送，错误只能在流中告知客户端
+            if output_format == 'vtt':
+                yield f"NOTE error: {str(e)}\n\n"
+            else:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    def close():
+        # 响应关闭时调用，生成器未开始执行时也会释放名额并删除音频
+        if audio_path:
+            audio_service.cleanup(audio_path)
+            whisper_processes.release()
+
+    mimetype = 'text/vtt' if output_format == 'vtt' else 'text/event-stream'
+    response = Response(stream_with_context(generate()), mimetype=mimetype, headers={'Cache-Control': 'no-cache'})
+    response.call_on_close(close)
+    return response
+
+@handle_api_error
+def create_whisper_job():
+    """
+    API endpoint to queue a Whisper transcription job
+    Body parameters (JSON or form):
+        video_id: YouTube video ID (required)
+        lang: Language code (optional, e.g., 'en', 'zh')
+        model: Whisper model size (optional, e.g., 'base', 'large')
+    """
+    params = request.get_json(silent=True) or request.form
+    video_id = params.get('video_id')
+    lang = params.get('lang')
+
+    if not video_id:
+        raise InvalidParameterError('Missing required parameter: video_id')
+
+    model = model_registry.resolve_size(params.get('model'))
+
+    job = whisper_jobs.submit(video_id, lang, model)
+    return jsonify({
+        'status': 'success',
+        'data': job
+    }), 202
+
+@handle_api_error
+def get_whisper_job(job_id):
+    """
+    API endpoint to get the state of a Whisper transcription job
+    Path parameters:
+        job_id: Job ID returned by POST /api/whisper/jobs
+    """
+    job = whisper_jobs.get(job_id)
+
+    if not job:
+        raise NotFoundError(f'Job not found: {job_id}')
+
+    return jsonify({
+        'status': 'success',
+        'data': job
+    })
+
+def get_metrics():
+    """
+    Prometheus metrics of this process: stage and request latency histograms,
+    request and error counters, cache and Whisper job state
+    """
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
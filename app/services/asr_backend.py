@@ -0,0 +1,265 @@
+"""
+Speech recognition backends behind the Whisper model registry
+
+A backend lists the model sizes it supports (a static list, so validating a
+request does not import the backend) and loads a model for a size.
+Every model exposes openai-whisper's `transcribe(audio, **options)` and returns
+{'language', 'segments', 'text'}, so the audio service works with any backend:
+
+    whisper      openai-whisper on PyTorch (fp32 on CPU)
+    ctranslate2  faster-whisper on CTranslate2, quantized (Config.ASR_COMPUTE_TYPE),
+                 with Config.ASR_CPU_THREADS threads and windows of concurrent
+                 transcriptions decoded together in one batch
+
+faster-whisper and whisper are imported when the first model is loaded.
+"""
+import copy
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, List, Optional, Sequence
+import numpy as np
+from ..config import config
+from ..metrics import registry, span, Histogram
+
+SAMPLE_RATE = 16000
+# Whisper 一次前向计算处理的最长音频
+CHUNK_SECONDS = 30
+
+# openai-whisper 和 faster-whisper 共有的模型名
+WHISPER_MODELS = (
+    'tiny.en', 'tiny', 'base.en', 'base', 'small.en', 'small', 'medium.en', 'medium',
+    'large-v1', 'large-v2', 'large-v3', 'large', 'large-v3-turbo', 'turbo',
+)
+
+batch_windows = registry.register(Histogram(
+    'yt_tools_asr_batch_windows', 'Audio windows decoded together in one batched forward pass',
+    buckets=(1, 2, 4, 8, 16, 32)))
+
+
+class WhisperBackend:
+    """openai-whisper models on PyTorch"""
+
+    name = 'whisper'
+    models = WHISPER_MODELS
+
+    def load_model(self, size: str, device: str):
+        import whisper
+
+        return whisper.load_model(size, device=device)
+
+
+class CTranslate2Backend:
+    """faster-whisper models on CTranslate2 with quantized weights and batched decoding"""
+
+    name = 'ctranslate2'
+    models = WHISPER_MODELS + ('distil-small.en', 'distil-medium.en', 'distil-large-v2', 'distil-large-v3')
+
+    def __init__(self, compute_type: str, cpu_threads: int, batch_size: int, batch_wait: float):
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+    def load_model(self, size: str, device: str):
+        from faster_whisper import WhisperModel
+
+        model = WhisperModel(size, device=device, compute_type=self.compute_type, cpu_threads=self.cpu_threads)
+        return CTranslate2Model(model, self.batch_size, self.batch_wait)
+
+
+class _BatchItem:
+    __slots__ = ('window', 'done', 'result', 'error')
+
+    def __init__(self, window: np.ndarray):
+        self.window = window
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _Batch:
+    __slots__ = ('items', 'full')
+
+    def __init__(self):
+        self.items: List[_BatchItem] = []
+        self.full = threading.Event()
+
+
+class WindowBatcher:
+    """
+    Groups audio windows submitted by concurrent threads into batches.
+
+    The first window submitted for a key waits up to `max_wait` seconds, or
+    until `max_size` windows with the same key have arrived, then decodes the
+    whole batch with `fn(key, windows)` on behalf of all submitters. Windows
+    only share a batch when their key (language and decoding options) matches.
+
+    Callers that submit window after window (streamed transcriptions, jobs)
+    hold a `session`. A batch stops waiting once every open session has a
+    window in it, so a lone caller never waits for peers that cannot come.
+    """
+
+    def __init__(self, fn: Callable[[Hashable, List[np.ndarray]], List], max_size: int, max_wait: float):
+        self.fn = fn
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: Dict[Hashable, _Batch] = {}
+        self._sessions = 0
+        self._lock = threading.Lock()
+
+    def _target(self) -> int:
+        # 调用方持有 self._lock
+        return min(self.max_size, max(self._sessions, 1))
+
+    @contextmanager
+    def session(self):
+        """Register a caller that will submit windows one after another"""
+        with self._lock:
+            self._sessions += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sessions -= 1
+                # 参与者减少后，等待中的批次可能已经等不到新的窗口
+                for key, batch in list(self._pending.items()):
+                    if len(batch.items) >= self._target():
+                        del self._pending[key]
+                        batch.full.set()
+
+    def submit(self, key: Hashable, window: np.ndarray):
+        """Decode one window, possibly together with windows from other threads"""
+        item = _BatchItem(window)
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._pending[key] = _Batch()
+            batch.items.append(item)
+            # 批次已满或所有会话都已提交窗口时不再等待，之后到达的窗口开始新的批次
+            if len(batch.items) >= self._target():
+                del self._pending[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._pending.get(key) is batch:
+                    del self._pending[key]
+            self._run(key, batch.items)
+
+        item.done.wait()
+        if item.error is not None:
+            raise copy.copy(item.error) from item.error
+        return item.result
+
+    def _run(self, key: Hashable, items: List[_BatchItem]) -> None:
+        batch_windows.observe(len(items))
+        try:
+            results = self.fn(key, [item.window for item in items])
+            for item, result in zip(items, results):
+                item.result = result
+        except BaseException as e:
+            for item in items:
+                item.error = e
+        finally:
+            for item in items:
+                item.done.set()
+
+
+def _segment(segment, shift: float = 0.0) -> Dict:
+    """Convert a faster-whisper segment to an openai-whisper style dict, shifted by `shift` seconds"""
+    item = {'start': segment.start + shift, 'end': segment.end + shift, 'text': segment.text}
+    if segment.words:
+        item['words'] = [
+            {'word': word.word, 'start': word.start + shift, 'end': word.end + shift,
+             'probability': word.probability}
+            for word in segment.words
+        ]
+    return item
+
+
+def _result(language: Optional[str], segments: List[Dict]) -> Dict:
+    return {'language': language, 'segments': segments, 'text': ''.join(s['text'] for s in segments)}
+
+
+class CTranslate2Model:
+    """
+    faster-whisper model with openai-whisper's transcribe interface
+
+    Windows of at most 30 seconds with a known language (streamed transcriptions
+    and jobs) go through a WindowBatcher: windows of concurrent transcriptions are
+    concatenated and decoded as the clips of one batched pipeline call. Longer
+    audio is split at speech boundaries and its chunks are decoded in batches.
+    Batched windows are decoded without a previous-text prompt.
+
+    Windowed transcriptions hold a `session` for their duration, so a window
+    only waits for peers while other transcriptions are running on the model.
+    """
+
+    def __init__(self, model, batch_size: int, batch_wait: float):
+        from faster_whisper import BatchedInferencePipeline
+
+        self.model = model
+        self.pipeline = BatchedInferencePipeline(model=model)
+        self.batch_size = batch_size
+        self._batcher = WindowBatcher(self._transcribe_batch, batch_size, batch_wait)
+
+    def session(self):
+        """Context manager held by a windowed transcription while it submits windows"""
+        return self._batcher.session()
+
+    def transcribe(self, audio: np.ndarray, language: Optional[str] = None,
+                   initial_prompt: Optional[str] = None, condition_on_previous_text: bool = True,
+                   word_timestamps: bool = False, **kwargs) -> Dict:
+        duration = len(audio) / SAMPLE_RATE
+        if duration <= CHUNK_SECONDS:
+            if language and self.batch_size > 1:
+                return _result(language, self._batcher.submit((language, word_timestamps), audio))
+            segments, info = self.model.transcribe(
+                audio, language=language, initial_prompt=initial_prompt,
+                condition_on_previous_text=condition_on_previous_text, word_timestamps=word_timestamps
+            )
+            return _result(info.language, [_segment(s) for s in segments])
+
+        segments, info = self.pipeline.transcribe(
+            audio, language=language, initial_prompt=initial_prompt, word_timestamps=word_timestamps,
+            batch_size=self.batch_size, without_timestamps=False
+        )
+        return _result(info.language, [_segment(s) for s in segments])
+
+    def _transcribe_batch(self, key: tuple, windows: Sequence[np.ndarray]) -> List[List[Dict]]:
+        language, word_timestamps = key
+        # 各窗口拼接后作为同一音频的多个片段，一次批量解码
+        clips, offsets, start = [], [], 0
+        for window in windows:
+            clips.append({'start': start, 'end': start + len(window)})
+            offsets.append(start / SAMPLE_RATE)
+            start += len(window)
+
+        with span('transcribe_batch'):
+            segments, _ = self.pipeline.transcribe(
+                np.concatenate(windows), language=language, word_timestamps=word_timestamps,
+                clip_timestamps=clips, vad_filter=False, batch_size=len(windows), without_timestamps=False
+            )
+            results: List[List[Dict]] = [[] for _ in windows]
+            for segment in segments:
+                # 片段起点可能因浮点误差略早于所属窗口的起点
+                index = max(bisect_right(offsets, segment.start + 1e-3) - 1, 0)
+                results[index].append(_segment(segment, -offsets[index]))
+        return results
+
+
+def create_backend(name: str):
+    """Return the ASR backend configured by name ('whisper' or 'ctranslate2')"""
+    if name == 'whisper':
+        return WhisperBackend()
+    if name == 'ctranslate2':
+        return CTranslate2Backend(
+            compute_type=config.ASR_COMPUTE_TYPE,
+            cpu_threads=config.ASR_CPU_THREADS,
+            batch_size=config.ASR_BATCH_SIZE,
+            batch_wait=config.ASR_BATCH_WAIT,
+        )
+    raise ValueError(f'Unknown ASR backend: {name}')
@@ -1,16 +1,166 @@
+import multiprocessing
 import os
+import shutil
+import subprocess
 import tempfile
-import whisper
-from typing import Dict, Optional
-import yt_dlp
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from queue import Empty
+from typing import Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
 from ..config import config
-from ..errors import YouTubeServiceError
+from ..errors import TooManyRequestsError, YouTubeServiceError
+from .. import vtt
+from ..metrics import span
+from .model_registry import model_registry
+from .single_flight import single_flight
+from .transcript_store import decoding_options, transcript_store
+from .ydl_pool import ydl_pool
 
-class YouTubeAudioService:
-    def __init__(self):
-        # 初始化 Whisper 模型
-        self.model = whisper.load_model("large", device="cpu")
+# Whisper 输入的采样率
+SAMPLE_RATE = 16000
+
+
+class WhisperProcessPool:
+    """
+    Bounded process pool for the CPU-bound transcription of Whisper requests
+
+    Request threads only download the audio and wait for (or stream) the result,
+    so transcriptions do not compete with request handling for the GIL. At most
+    `workers + queue` videos are admitted at a time; further requests get
+    TooManyRequestsError (429). With workers=0 transcriptions run in the request
+    thread without a limit.
+
+    `start` forks the processes before any request thread exists, after models
+    are preloaded, so preloaded weights are shared copy-on-write. A process that
+    uses the pool without starting it (e.g. forked after start) gets a pool from
+    a forkserver instead, which is safe to create from a request thread.
+    """
+
+    def __init__(self, workers: int, queue: int):
+        self.workers = workers
+        self.queue = queue
+        self.limit = workers + queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._pid: Optional[int] = None
+        self._admitted = 0
+        self._lock = threading.Lock()
+
+    def start(self, workers: Optional[int] = None) -> None:
+        """Fork `workers` processes (default: the configured number) and wait until they are running"""
+        if workers is not None:
+            self.workers = workers
+            self.limit = workers + self.queue
+        if self.workers:
+            executor, _ = self._pool(multiprocessing.get_context('fork'))
+            # 进程池在第一次提交任务时才创建工作进程
+            executor.submit(os.getpid).result()
+
+    def _pool(self, context=None):
+        with self._lock:
+            # 进程池不能跨 fork 使用，每个进程创建自己的；请求线程中只能通过 forkserver 创建
+            if self._executor is None or self._pid != os.getpid():
+                context = context or multiprocessing.get_context('forkserver')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                # 流式转写通过 manager 的队列逐段取回结果
+                self._manager = context.Manager()
+                self._pid = os.getpid()
+            return self._executor, self._manager
+
+    def acquire(self) -> None:
+        """Take a place in the pool for one video, from its download until it is transcribed"""
+        if not self.workers:
+            return
+        with self._lock:
+            if self._admitted >= self.limit:
+                raise TooManyRequestsError(f"Too many Whisper transcriptions in progress ({self._admitted}), retry later")
+            self._admitted += 1
+
+    def release(self) -> None:
+        if not self.workers:
+            return
+        with self._lock:
+            self._admitted -= 1
+
+    @contextmanager
+    def reserve(self):
+        """Hold a place in the pool for the duration of the block"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def call(self, fn: Callable, *args):
+        """Run fn(*args) in a worker process and wait for its result"""
+        executor, _ = self._pool()
+        return executor.submit(fn, *args).result()
+
+    def stream(self, fn: Callable, *args) -> Iterator:
+        """
+        Run fn(*args, queue, stop) in a worker process and yield the items it puts on queue
+
+        fn puts None when it is done. Closing the generator sets the `stop` event,
+        which fn checks between items so abandoned work ends early.
+        """
+        executor, manager = self._pool()
+        queue, stop = manager.Queue(), manager.Event()
+        future = executor.submit(fn, *args, queue, stop)
+        try:
+            while True:
+                try:
+                    item = queue.get(timeout=1)
+                except Empty:
+                    # 工作进程异常退出时不会放入结束标记
+                    if future.done():
+                        future.result()
+                        raise YouTubeServiceError("Whisper worker stopped without finishing the transcription")
+                    continue
+                if item is None:
+                    break
+                yield item
+            future.result()
+        finally:
+            stop.set()
+            future.cancel()
+
+    def admitted(self) -> int:
+        with self._lock:
+            return self._admitted
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                if self._manager is not None:
+                    self._manager.shutdown()
+            self._executor = None
+            self._manager = None
+
+
+whisper_processes = WhisperProcessPool(config.WHISPER_PROCESS_WORKERS, config.WHISPER_PROCESS_QUEUE)
+
+
+def _transcribe_file(audio_path: str, language: Optional[str], model_size: str) -> Dict:
+    """Process pool entry point: decode and transcribe an already downloaded file"""
+    return YouTubeAudioService().transcribe_segments(audio_path, language, model_size)
 
+
+def _stream_file(audio_path: str, language: Optional[str], model_size: str, queue, stop) -> None:
+    """Process pool entry point: put (detected language, segment) pairs on queue as they are transcribed"""
+    info = {'language': language}
+    try:
+        for segment in YouTubeAudioService().iter_segments(audio_path, language, model_size, info):
+            if stop.is_set():
+                break
+            queue.put((info['language'], segment))
+    finally:
+        queue.put(None)
+
+
+class YouTubeAudioService:
     @staticmethod
     def get_video_url(video_id: str) -> str:
         """Construct YouTube video URL from video ID"""
@@ -19,6 +169,11 @@ class YouTubeAudioService:
     def download_audio(self, video_id: str) -> str:
         """
         Download audio from YouTube video
+
+        The best audio stream is kept in its native container (no MP3 re-encode);
+        it is decoded once, directly to 16 kHz mono PCM, when it is transcribed.
+        Every download gets its own temporary directory, so concurrent requests for
+        the same video do not overwrite each other's files. Call `cleanup` when done.
         
         Args:
             video_id (str): YouTube video ID
@@ -26,71 +181,329 @@ class YouTubeAudioService:
         Returns:
             str: Path to the downloaded audio file
         """
+        job_dir = tempfile.mkdtemp(prefix=f'yt-audio-{video_id}-')
         ydl_opts = {
             'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'outtmpl': os.path.join(tempfile.gettempdir(), f'{video_id}.%(ext)s'),
+            'outtmpl': os.path.join(job_dir, 'audio.%(ext)s'),
             'quiet': True,
-            'cookiesfrombrowser': ('firefox', None, None),
         }
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([self.get_video_url(video_id)])
+            # 输出目录每次不同，实例不放回池中，但仍共享已加载的 cookies
+            with span('audio_download'), ydl_pool.acquire(ydl_opts, reusable=False) as ydl:
+                info = ydl.extract_info(self.get_video_url(video_id), download=True)
                 # 获取下载的文件路径
-                audio_path = os.path.join(tempfile.gettempdir(), f'{video_id}.mp3')
-                if not os.path.exists(audio_path):
+                downloads = info.get('requested_downloads') or []
+                audio_path = downloads[0].get('filepath') if downloads else ydl.prepare_filename(info)
+                if not audio_path or not os.path.exists(audio_path):
                     raise YouTubeServiceError("Failed to download audio")
                 return audio_path
         except Exception as e:
+            shutil.rmtree(job_dir, ignore_errors=True)
             raise YouTubeServiceError(f"Failed to download audio: {str(e)}")
 
-    def generate_subtitles(self, audio_path: str, language: Optional[str] = None) -> str:
+    @staticmethod
+    def cleanup(audio_path: str) -> None:
+        """Remove a downloaded audio file together with its temporary directory"""
+        shutil.rmtree(os.path.dirname(audio_path), ignore_errors=True)
+
+    @staticmethod
+    def decode_audio(audio_path: str) -> np.ndarray:
         """
-        Generate subtitles from audio using Whisper
-        
+        Decode audio in a single ffmpeg pass to the 16 kHz mono float32 array Whisper expects
+
+        Args:
+            audio_path (str): Path to the audio file in any container ffmpeg can read
+
+        Returns:
+            np.ndarray: Audio samples in [-1, 1]
+        """
+        with span('ffmpeg_decode'):
+            process = subprocess.run(
+                ['ffmpeg', '-nostdin', '-threads', '0', '-i', audio_path,
+                 '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        if process.returncode != 0:
+            raise YouTubeServiceError(f"Failed to decode audio: {process.stderr.decode(errors='ignore')[-500:]}")
+        return np.frombuffer(process.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+    @staticmethod
+    def normalize_segment(segment: Dict, offset: float = 0.0, limit: Optional[float] = None) -> Dict:
+        """
+        Keep the fields of a Whisper segment worth storing, shifted by `offset` seconds
+
+        Word timestamps are kept when Whisper returned them (Config.WHISPER_WORD_TIMESTAMPS).
+        """
+        end = offset + segment['end']
+        item = {
+            'start': offset + segment['start'],
+            'end': end if limit is None else min(end, limit),
+            'text': segment['text'].strip()
+        }
+        if segment.get('words'):
+            item['words'] = [
+                {'word': word['word'], 'start': offset + word['start'], 'end': offset + word['end']}
+                for word in segment['words']
+            ]
+        return item
+
+    def transcribe_segments(self, audio_path: str, language: Optional[str] = None,
+                            model_size: Optional[str] = None) -> Dict:
+        """
+        Transcribe a whole audio file with Whisper
+
         Args:
             audio_path (str): Path to the audio file
             language (Optional[str]): Language code (e.g., 'en', 'zh')
-            
+            model_size (Optional[str]): Whisper model size (default: Config.WHISPER_MODEL_SIZE)
+
         Returns:
-            str: Subtitles in VTT format
+            Dict: 'language' detected (or given) and the non-empty 'segments'
         """
+        kwargs = {}
+        if language:
+            kwargs['language'] = language
+        if config.WHISPER_WORD_TIMESTAMPS:
+            kwargs['word_timestamps'] = True
+
+        # 直接把 PCM 数组交给 Whisper，避免再次调用 ffmpeg
+        samples = self.decode_audio(audio_path)
+
+        # 使用 Whisper 生成字幕，模型在首次使用时加载
+        with model_registry.use(model_size) as model, span('transcribe'):
+            result = model.transcribe(samples, **kwargs)
+
+        segments = [self.normalize_segment(segment) for segment in result['segments']]
+        return {
+            'language': language or result.get('language'),
+            'segments': [segment for segment in segments if segment['text']]
+        }
+
+    def transcribe_video(self, video_id: str, language: Optional[str] = None,
+                         model_size: Optional[str] = None) -> Dict:
+        """
+        Download a video's audio and transcribe it with Whisper
+
+        A transcript already in the transcript store is returned without downloading
+        anything. Otherwise concurrent calls for the same video, language and model
+        share one download and one transcription (the others wait up to
+        Config.WHISPER_FLIGHT_TIMEOUT), and the result is stored for later calls.
+        The transcription runs in the Whisper process pool when
+        Config.WHISPER_PROCESS_WORKERS is set.
+
+        Raises:
+            TooManyRequestsError: The process pool already has Config.WHISPER_PROCESS_QUEUE videos waiting
+
+        Returns:
+            Dict: 'segments', transcription 'language' and whether the result was 'cached'
+        """
+        model_size = model_registry.resolve_size(model_size)
+        options = decoding_options()
+
+        with span('transcript_lookup'):
+            stored = transcript_store.get(video_id, model_size, language, options)
+        if stored is not None:
+            return {'segments': stored['segments'], 'language': stored['detected_language'], 'cached': True}
+
+        def run():
+            with whisper_processes.reserve():
+                audio_path = self.download_audio(video_id)
+                try:
+                    if whisper_processes.workers:
+                        with span('transcribe'):
+                            result = whisper_processes.call(_transcribe_file, audio_path, language, model_size)
+                    else:
+                        result = self.transcribe_segments(audio_path, language, model_size)
+                except Exception as e:
+                    raise YouTubeServiceError(f"Failed to generate subtitles: {str(e)}")
+                finally:
+                    self.cleanup(audio_path)
+            with span('transcript_write'):
+                transcript_store.put(video_id, model_size, language, options,
+                                     result['segments'], result['language'])
+            return result
+
+        result = single_flight.do(('whisper', video_id, language, model_size), run,
+                                  timeout=config.WHISPER_FLIGHT_TIMEOUT)
+        return dict(result, cached=False)
+
+    @staticmethod
+    def find_silence_cut(samples: np.ndarray, frame_size: int) -> int:
+        """Return the index of the quietest frame centre in samples, used as a window cut point"""
+        frames = len(samples) // frame_size
+        if frames == 0:
+            return len(samples)
+        energy = np.square(samples[:frames * frame_size].reshape(frames, frame_size)).mean(axis=1)
+        return int(np.argmin(energy)) * frame_size + frame_size // 2
+
+    @staticmethod
+    def iter_audio_windows(audio_path: str,
+                           window_seconds: float = config.WHISPER_STREAM_WINDOW,
+                           search_seconds: float = config.WHISPER_STREAM_SILENCE_SEARCH,
+                           overlap_seconds: float = config.WHISPER_STREAM_OVERLAP
+                           ) -> Iterator[Tuple[float, np.ndarray]]:
+        """
+        Decode audio through an ffmpeg pipe and yield it in windows cut at quiet points
+
+        Each window is at most `window_seconds` long. Its end is moved to the quietest
+        20 ms frame within the last `search_seconds`, so cues are rarely split mid-word.
+        The next window starts `overlap_seconds` before that cut, so a word the cut
+        still clips is heard whole by one of the two windows. The PCM is read straight
+        into one preallocated window buffer.
+
+        Args:
+            audio_path (str): Path to the audio file
+            window_seconds (float): Maximum window length in seconds
+            search_seconds (float): Length of the tail searched for a silence boundary
+            overlap_seconds (float): Audio repeated at the start of the next window
+
+        Yields:
+            Tuple[float, np.ndarray]: Window start offset in seconds and 16 kHz mono float32 samples
+        """
+        window_size = int(window_seconds * SAMPLE_RATE)
+        search_size = int(search_seconds * SAMPLE_RATE)
+        overlap_size = int(overlap_seconds * SAMPLE_RATE)
+        frame_size = SAMPLE_RATE // 50
+
+        process = subprocess.Popen(
+            ['ffmpeg', '-nostdin', '-threads', '0', '-i', audio_path,
+             '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        buffer = np.empty(window_size, dtype=np.int16)
+        raw = buffer.view(np.uint8)
+        # 管道可能返回奇数个字节，按字节计数，多出的字节随下一个窗口保留
+        filled = 0
+        offset = 0
+        eof = False
+
         try:
-            # 设置语言参数
-            kwargs = {}
-            if language:
-                kwargs['language'] = language
+            while True:
+                while not eof and filled < len(raw):
+                    read = process.stdout.readinto(memoryview(raw)[filled:])
+                    if not read:
+                        eof = True
+                        break
+                    filled += read
 
-            # 使用 Whisper 生成字幕
-            result = self.model.transcribe(audio_path, **kwargs)
-            
-            # 转换为 VTT 格式
-            vtt_content = "WEBVTT\n\n"
-            for i, segment in enumerate(result['segments'], 1):
-                start = self.format_time(segment['start'])
-                end = self.format_time(segment['end'])
-                text = segment['text'].strip()
-                vtt_content += f"{i}\n{start} --> {end}\n{text}\n\n"
-
-            return vtt_content
-        except Exception as e:
-            raise YouTubeServiceError(f"Failed to generate subtitles: {str(e)}")
+                size = filled // 2
+                if size == 0:
+                    break
+
+                if size < window_size:
+                    cut = size
+                else:
+                    tail_start = window_size - search_size
+                    tail = buffer[tail_start:].astype(np.float32)
+                    cut = tail_start + YouTubeAudioService.find_silence_cut(tail, frame_size)
+
+                yield offset / SAMPLE_RATE, buffer[:cut].astype(np.float32) / 32768.0
+                if eof and cut == size:
+                    break
+
+                # 下一个窗口从切点之前 overlap_size 处开始，剩余数据移到缓冲区开头
+                start = cut - min(overlap_size, cut // 2)
+                raw[:filled - start * 2] = raw[start * 2:filled]
+                filled -= start * 2
+                offset += start
         finally:
-            # 清理临时文件
-            try:
-                os.remove(audio_path)
-            except:
-                pass
+            process.stdout.close()
+            process.kill()
+            process.wait()
+
+        if process.returncode not in (0, -9) and offset == 0:
+            raise YouTubeServiceError("Failed to decode audio")
+
+    @staticmethod
+    def batch_session(model):
+        """Session of a model that batches windows across transcriptions (see asr_backend), if any"""
+        session = getattr(model, 'session', None)
+        return session() if session else nullcontext()
+
+    def iter_segments(self, audio_path: str, language: Optional[str] = None,
+                      model_size: Optional[str] = None, info: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Transcribe audio window by window and yield each segment as soon as it is ready
+
+        The language detected on the first window is reused for the following ones,
+        and the text of the previous window is passed as the prompt to keep context.
+        Windows overlap (see iter_audio_windows); a segment whose midpoint lies in
+        audio already covered by emitted segments is dropped, and a kept segment
+        starts no earlier than the last emitted one ended.
+
+        Args:
+            audio_path (str): Path to the audio file
+            language (Optional[str]): Language code (e.g., 'en', 'zh')
+            model_size (Optional[str]): Whisper model size (default: Config.WHISPER_MODEL_SIZE)
+            info (Optional[Dict]): If given, its 'language' is set to the language detected
+                on the first window (or the requested one) before the first segment is yielded
+
+        Yields:
+            Dict: Segment with absolute 'start' and 'end' in seconds, 'text' and, when enabled, 'words'
+        """
+        with model_registry.use(model_size) as model, self.batch_session(model):
+            prompt = None
+            emitted_end = 0.0
+            for offset, samples in self.iter_audio_windows(audio_path):
+                kwargs = {'condition_on_previous_text': False}
+                if config.WHISPER_WORD_TIMESTAMPS:
+                    kwargs['word_timestamps'] = True
+                if language:
+                    kwargs['language'] = language
+                if prompt:
+                    kwargs['initial_prompt'] = prompt
+
+                with span('transcribe'):
+                    result = model.transcribe(samples, **kwargs)
+                language = language or result.get('language')
+                if info is not None:
+                    info['language'] = language
+                window_end = offset + len(samples) / SAMPLE_RATE
+
+                texts = []
+                for segment in result['segments']:
+                    segment = self.normalize_segment(segment, offset, window_end)
+                    if not segment['text']:
+                        continue
+                    # 重叠部分已由上一窗口转写，跳过重复的片段
+                    if (segment['start'] + segment['end']) / 2 <= emitted_end:
+                        continue
+                    segment['start'] = max(segment['start'], emitted_end)
+                    if 'words' in segment:
+                        segment['words'] = [word for word in segment['words']
+                                            if (word['start'] + word['end']) / 2 > emitted_end]
+                    emitted_end = max(emitted_end, segment['end'])
+                    texts.append(segment['text'])
+                    yield segment
+                prompt = ' '.join(texts) or None
+
+    def stream_segments(self, audio_path: str, language: Optional[str] = None,
+                        model_size: Optional[str] = None, info: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        iter_segments, run in the Whisper process pool when Config.WHISPER_PROCESS_WORKERS is set
+
+        Segments are passed back from the worker process as soon as each one is
+        transcribed; closing the iterator stops the transcription. The caller holds
+        a place in the pool (whisper_processes.acquire) while it streams.
+        """
+        if not whisper_processes.workers:
+            yield from self.iter_segments(audio_path, language, model_size, info)
+            return
+        for detected, segment in whisper_processes.stream(_stream_file, audio_path, language, model_size):
+            if info is not None:
+                info['language'] = detected
+            yield segment
+
+    @staticmethod
+    def format_cue(index: int, segment: Dict) -> str:
+        """Format a segment as a numbered VTT cue"""
+        return vtt.format_cue(index, vtt.seconds_to_ms(segment['start']),
+                              vtt.seconds_to_ms(segment['end']), segment['text'])
 
     @staticmethod
     def format_time(seconds: float) -> str:
         """Format seconds to VTT time format (HH:MM:SS.mmm)"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = seconds % 60
-        return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}" 
\ No newline at end of file
+        return vtt.format_timestamp(vtt.seconds_to_ms(seconds)) 
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, Iterator, List, Union
+from ..config import config
+from .subtitle_service import YouTubeSubtitleService
+
+# 所有批量请求共享的线程池
+executor = ThreadPoolExecutor(max_workers=config.BATCH_MAX_WORKERS, thread_name_prefix='subtitle-batch')
+
+
+class SubtitleBatchService:
+    @staticmethod
+    def capture_one(video_id: str, langs: Union[List[str], str], pure_text: bool, translate: bool = True) -> Dict:
+        """Capture a video's subtitle tracks, reporting failures in the result instead of raising"""
+        try:
+            return {
+                'status': 'success',
+                'video_id': video_id,
+                'langs': langs,
+                'data': YouTubeSubtitleService.capture_subtitles(video_id, langs, pure_text, translate)
+            }
+        except Exception as e:
+            return {
+                'status': 'error',
+                'video_id': video_id,
+                'langs': langs,
+                'error': str(e)
+            }
+
+    @staticmethod
+    def iter_results(video_ids: Iterable[str], langs: Union[List[str], str], pure_text: bool = False,
+                     translate: bool = True) -> Iterator[Dict]:
+        """
+        Capture subtitles for many videos concurrently, yielding results as they finish
+
+        All languages of a video are fetched by one task, with a single extract_info.
+
+        At most Config.BATCH_MAX_WORKERS items of a batch are in flight at a time;
+        outgoing requests are further limited per host by the shared HostLimiter.
+        Items not yet started are cancelled if the consumer stops iterating.
+
+        Args:
+            video_ids (Iterable[str]): YouTube video IDs
+            langs (Union[List[str], str]): Language codes to fetch for every video, or 'all'
+            pure_text (bool): Whether to return only pure text
+            translate (bool): Whether auto-translated captions may be used
+
+        Yields:
+            Dict: One result per video, in completion order
+        """
+        pending = set()
+
+        try:
+            for video_id in video_ids:
+                pending.add(executor.submit(SubtitleBatchService.capture_one, video_id, langs, pure_text, translate))
+                if len(pending) < config.BATCH_MAX_WORKERS:
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+def make_subtitle_key(video_id: str, lang: str, kind: str) -> str:
+    """Build the cache key for a subtitle track (kind is 'manual' or 'auto')"""
+    return f"{video_id}:{lang}:{kind}"
+
+
+class MemoryStore:
+    """In-process LRU store bounded by the total size of the cached values"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def set(self, key: str, expires_at: float, value: str) -> None:
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        self.delete(key)
+        self._items[key] = (expires_at, value)
+        self.current_bytes += size
+        # 超出容量时淘汰最久未使用的条目
+        while self.current_bytes > self.max_bytes and self._items:
+            _, (_, old_value) = self._items.popitem(last=False)
+            self.current_bytes -= len(old_value.encode('utf-8'))
+
+    def delete(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.current_bytes -= len(item[1].encode('utf-8'))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SQLiteStore:
+    """On-disk store backed by a single SQLite table"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS subtitle_cache ('
+            'key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS subtitle_cache_expires ON subtitle_cache (expires_at)'
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT expires_at, value FROM subtitle_cache WHERE key = ?', (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, expires_at: float, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO subtitle_cache (key, expires_at, value) VALUES (?, ?, ?)',
+                (key, expires_at, value)
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM subtitle_cache WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def purge_expired(self, now: float) -> int:
+        """Delete every expired entry and return how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM subtitle_cache WHERE expires_at <= ?', (now,))
+            self._conn.commit()
+        return cursor.rowcount
+
+
+class FileStore:
+    """On-disk store keeping one file per entry, named by the hash of its key"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                expires_at = float(f.readline())
+                return expires_at, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, expires_at: float, value: str) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f"{expires_at}\n")
+            f.write(value)
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def purge_expired(self, now: float) -> int:
+        """Delete every expired entry file and return how many were removed"""
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    expires_at = float(f.readline())
+                if expires_at <= now:
+                    os.remove(entry.path)
+                    removed += 1
+            except (OSError, ValueError):
+                continue
+        return removed
+
+
+class SubtitleCache:
+    """
+    Two-tier subtitle cache: an in-process LRU in front of an optional persistent store.
+
+    Entries expire after `ttl` seconds. Hits from the persistent store are
+    promoted into memory so repeated lookups stay in-process. The lock only
+    guards the in-memory LRU and counters; persistent store I/O runs outside it,
+    and expired entries are swept from the store every `sweep_interval` seconds.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int, store=None, sweep_interval: float = 600):
+        self.ttl = ttl
+        self.memory = MemoryStore(max_bytes)
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            item = self.memory.get(key)
+            if item is not None and item[0] <= now:
+                self.memory.delete(key)
+        if item is not None and item[0] > now:
+            return item[1]
+        if self.store is None:
+            return None
+
+        if item is None:
+            item = self.store.get(key)
+            if item is None:
+                return None
+            if item[0] > now:
+                with self._lock:
+                    self.memory.set(key, item[0], item[1])
+                return item[1]
+        self.store.delete(key)
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None if missing or expired"""
+        return self.get_first([key])[1]
+
+    def get_first(self, keys: Iterable[str]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Look up keys in order and return the first live entry
+
+        A lookup counts as a single hit or miss regardless of how many keys are tried.
+
+        Returns:
+            Tuple[Optional[str], Optional[str]]: (matching key, value), or (None, None)
+        """
+        now = time.time()
+        for key in keys:
+            value = self._get(key, now)
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                return key, value
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def set(self, key: str, value: str) -> None:
+        """Store value under key for the configured TTL"""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self.memory.set(key, expires_at, value)
+        if self.store is not None:
+            self.store.set(key, expires_at, value)
+            self._sweep(now)
+
+    def _sweep(self, now: float) -> None:
+        # 过期条目只在再次读取时删除，持久化存储需要定期清理
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        removed = self.store.purge_expired(now)
+        if removed:
+            logger.info("Purged %d expired subtitle cache entries", removed)
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and memory usage"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.memory),
+                'bytes': self.memory.current_bytes,
+                'max_bytes': self.memory.max_bytes,
+            }
+
+
+def create_store(kind: Optional[str], path: str):
+    """Create the persistent store configured by Config.SUBTITLE_CACHE_STORE"""
+    if not kind:
+        return None
+    if kind == 'sqlite':
+        return SQLiteStore(path)
+    if kind == 'file':
+        return FileStore(path)
+    raise ValueError(f"Unknown subtitle cache store: {kind}")
+
+
+subtitle_cache = SubtitleCache(
+    ttl=config.SUBTITLE_CACHE_TTL,
+    max_bytes=config.SUBTITLE_CACHE_MAX_BYTES,
+    store=create_store(config.SUBTITLE_CACHE_STORE, config.SUBTITLE_CACHE_PATH),
+    sweep_interval=config.SUBTITLE_CACHE_SWEEP_INTERVAL,
+)
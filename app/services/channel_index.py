@@ -0,0 +1,168 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from ..config import config
+
+
+class ChannelIndex:
+    """
+    Persistent per-channel video index.
+
+    Every video gets a per-channel sequence number in discovery order (higher
+    is listed first) and the time it was first seen, so results can be paginated
+    and filtered with `since` without crawling the channel again.
+
+    Flat feed listings carry no upload timestamps, so the order is not a global
+    upload order: videos found by a later sync rank above all earlier ones, and
+    within one sync each feed (videos, shorts, streams, then playlists) keeps its
+    own newest-first order, with earlier feeds ranked above later ones.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._sync_locks: Dict[str, threading.Lock] = {}
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS channels ('
+                'channel_id TEXT PRIMARY KEY, last_sync REAL, last_full_sync REAL, '
+                'next_seq INTEGER NOT NULL DEFAULT 0)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS channel_videos ('
+                'channel_id TEXT NOT NULL, video_id TEXT NOT NULL, seq INTEGER NOT NULL, '
+                'first_seen REAL NOT NULL, PRIMARY KEY (channel_id, video_id))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS channel_playlists ('
+                'playlist_id TEXT PRIMARY KEY, channel_id TEXT NOT NULL, size INTEGER, '
+                'video_ids TEXT NOT NULL, fetched_at REAL NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS channel_videos_seq ON channel_videos (channel_id, seq)'
+            )
+
+    def sync_lock(self, channel_id: str) -> threading.Lock:
+        """Lock serializing syncs of one channel within this process"""
+        with self._lock:
+            return self._sync_locks.setdefault(channel_id, threading.Lock())
+
+    def get_channel(self, channel_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM channels WHERE channel_id = ?', (channel_id,)).fetchone()
+        return dict(row) if row else None
+
+    def known_ids(self, channel_id: str) -> set:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT video_id FROM channel_videos WHERE channel_id = ?', (channel_id,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def add_videos(self, channel_id: str, video_ids_newest_first: List[str]) -> int:
+        """
+        Add videos in listing order; the last of them gets the lowest sequence number
+
+        `video_ids_newest_first` is the concatenation of newest-first feeds, so the
+        order is only newest-first within each feed (see the class docstring).
+
+        Returns:
+            int: Number of videos that were not in the index yet
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO channels (channel_id) VALUES (?)', (channel_id,))
+            next_seq = self._conn.execute(
+                'SELECT next_seq FROM channels WHERE channel_id = ?', (channel_id,)
+            ).fetchone()[0]
+            added = 0
+            for video_id in reversed(video_ids_newest_first):
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO channel_videos (channel_id, video_id, seq, first_seen) VALUES (?, ?, ?, ?)',
+                    (channel_id, video_id, next_seq, now)
+                )
+                if cursor.rowcount:
+                    next_seq += 1
+                    added += 1
+            self._conn.execute('UPDATE channels SET next_seq = ? WHERE channel_id = ?', (next_seq, channel_id))
+        return added
+
+    def mark_synced(self, channel_id: str, full: bool) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO channels (channel_id) VALUES (?)', (channel_id,))
+            if full:
+                self._conn.execute(
+                    'UPDATE channels SET last_sync = ?, last_full_sync = ? WHERE channel_id = ?',
+                    (now, now, channel_id)
+                )
+            else:
+                self._conn.execute('UPDATE channels SET last_sync = ? WHERE channel_id = ?', (now, channel_id))
+
+    def get_playlist(self, playlist_id: str) -> Optional[Dict]:
+        """Return the cached contents of a playlist, if any"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM channel_playlists WHERE playlist_id = ?', (playlist_id,)
+            ).fetchone()
+        if not row:
+            return None
+        playlist = dict(row)
+        playlist['video_ids'] = json.loads(playlist['video_ids'])
+        return playlist
+
+    def save_playlist(self, channel_id: str, playlist_id: str, size: Optional[int], video_ids: List[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO channel_playlists (playlist_id, channel_id, size, video_ids, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (playlist_id, channel_id, size, json.dumps(video_ids), time.time())
+            )
+
+    @staticmethod
+    def _filter(channel_id: str, since: Optional[float]):
+        where, params = 'channel_id = ?', [channel_id]
+        if since is not None:
+            where += ' AND first_seen > ?'
+            params.append(since)
+        return where, params
+
+    def count(self, channel_id: str, since: Optional[float] = None) -> int:
+        where, params = self._filter(channel_id, since)
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM channel_videos WHERE {where}', params).fetchone()[0]
+
+    def iter_videos(self, channel_id: str, since: Optional[float] = None,
+                    offset: int = 0, limit: Optional[int] = None, batch_size: int = 1000) -> Iterator[str]:
+        """
+        Lazily yield indexed video IDs in discovery order, most recently listed first
+
+        Uses its own connection so a slow consumer does not hold the index lock.
+        """
+        where, params = self._filter(channel_id, since)
+        params += [limit if limit is not None else -1, offset]
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cursor = conn.execute(
+                f'SELECT video_id FROM channel_videos WHERE {where} ORDER BY seq DESC LIMIT ? OFFSET ?', params
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[0]
+        finally:
+            conn.close()
+
+    def list_videos(self, channel_id: str, since: Optional[float] = None,
+                    offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """List indexed video IDs in discovery order, most recently listed first"""
+        return list(self.iter_videos(channel_id, since, offset, limit))
+
+channel_index = ChannelIndex(config.CHANNEL_INDEX_PATH)
@@ -1,7 +1,19 @@
-from typing import List, Dict
-import yt_dlp
+import contextvars
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Iterable, Iterator, Optional
 from ..config import config
-from ..errors import YouTubeServiceError
+from ..errors import YouTubeServiceError, InvalidParameterError
+from ..metrics import span
+from .channel_index import channel_index
+from .rate_limit import host_limiter
+from .ydl_pool import ydl_pool
+
+logger = logging.getLogger(__name__)
+
+SYNC_MODES = ('auto', 'delta', 'full', 'none')
 
 class YouTubeChannelService:
     @staticmethod
@@ -15,76 +27,270 @@ class YouTubeChannelService:
         return f"{config.YOUTUBE_BASE_URL}/{channel_id}/playlists"
 
     @staticmethod
-    def get_video_ids_from_entries(entries: List[Dict]) -> List[str]:
-        """Extract video IDs from entries"""
-        # xx = [entry['id'] for entry in entries if entry.get('id')]
-        print("get_video_ids_from_entries..")
-        reqult = []
+    def get_tab_urls(channel_id: str) -> List[str]:
+        """Construct the channel feed URLs that list uploads newest first"""
+        return [f"{config.YOUTUBE_BASE_URL}/{channel_id}/{tab}" for tab in ('videos', 'shorts', 'streams')]
+
+    @staticmethod
+    def iter_video_ids_from_entries(entries: Iterable[Dict]) -> Iterator[str]:
+        """Lazily yield video IDs from (possibly nested) entries without materializing them"""
         for entry in entries:
+            if not entry:
+                continue
             if entry.get('entries'):
-                for sub in entry.get('entries'):
-                    if sub.get("id"):
-                        reqult.append(sub.get("id"))
-            elif  entry.get('id'):
-                reqult.append(entry.get("id"))
-            print(reqult)
-        return reqult
+                yield from YouTubeChannelService.iter_video_ids_from_entries(entry['entries'])
+            elif entry.get('id'):
+                yield entry['id']
 
-        
-        # return [entry['id'] for entry in entries if entry.get('id')]
+    @staticmethod
+    def get_video_ids_from_entries(entries: Iterable[Dict]) -> List[str]:
+        """Extract video IDs from entries"""
+        return list(YouTubeChannelService.iter_video_ids_from_entries(entries))
 
     @staticmethod
-    def get_all_videos(channel_id: str) -> List[str]:
+    def iter_all_videos(channel_id: str) -> Iterator[str]:
         """
-        Get all video IDs from a YouTube channel, including videos in playlists
+        Yield all video IDs from a YouTube channel, including videos in playlists
+
+        Channel feeds are read lazily, newest first, and each ID is yielded once.
         
         Args:
             channel_id (str): The ID of the YouTube channel
             
-        Returns:
-            List[str]: List of video IDs
+        Yields:
+            str: Video ID
         """
         ydl_opts = {
             'extract_flat': True,
             'quiet': True,
             'ignoreerrors': True,
-            'playlistend': config.MAX_PLAYLIST_ITEMS,
-            'extract_playlist': True,
-            'cookiesfrombrowser': ('firefox', None, None),
         }
-        
-        video_ids = set()
-        
+        seen = set()
+        started = time.monotonic()
+
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with ydl_pool.acquire(ydl_opts) as ydl:
                 # Get channel videos
-                channel_url = YouTubeChannelService.get_channel_url(channel_id)
-                channel_info = ydl.extract_info(channel_url, download=False)
-                print(channel_info)
-                
-                if not channel_info:
-                    return []
-                
-                if 'entries' in channel_info:
-                    video_ids.update(YouTubeChannelService.get_video_ids_from_entries(channel_info['entries']))
-                
-                # Get videos from playlists
-                # playlists_url = YouTubeChannelService.get_playlists_url(channel_id)
-                # playlists_info = ydl.extract_info(playlists_url, download=False)
-                
-                # if playlists_info and 'entries' in playlists_info:
-                #     for playlist in playlists_info['entries']:
-                #         if playlist.get('id'):
-                #             playlist_url = f"{config.YOUTUBE_BASE_URL}/playlist?list={playlist['id']}"
-                #             try:
-                #                 playlist_info = ydl.extract_info(playlist_url, download=False)
-                #                 if playlist_info and 'entries' in playlist_info:
-                #                     video_ids.update(YouTubeChannelService.get_video_ids_from_entries(playlist_info['entries']))
-                #             except Exception as e:
-                #                 print(f"Error processing playlist {playlist['id']}: {str(e)}")
-                #                 continue
-                
+                for feed_url in YouTubeChannelService.get_tab_urls(channel_id):
+                    feed_started = time.monotonic()
+                    feed_count = 0
+                    for video_id in YouTubeChannelService.iter_feed_video_ids(ydl, feed_url):
+                        if video_id not in seen:
+                            seen.add(video_id)
+                            feed_count += 1
+                            yield video_id
+                    logger.debug("Crawled %s: %d videos in %.2fs", feed_url, feed_count, time.monotonic() - feed_started)
+
+            # Get videos from playlists
+            playlist_started = time.monotonic()
+            playlist_count = 0
+            for video_id in YouTubeChannelService.crawl_playlists(channel_id):
+                if video_id not in seen:
+                    seen.add(video_id)
+                    playlist_count += 1
+                    yield video_id
+            logger.debug("Crawled playlists of %s: %d new videos in %.2fs",
+                         channel_id, playlist_count, time.monotonic() - playlist_started)
+
         except Exception as e:
             raise YouTubeServiceError(f"Failed to get channel videos: {str(e)}")
+
+        logger.info("Crawled channel %s: %d videos in %.2fs", channel_id, len(seen), time.monotonic() - started)
+
+    @staticmethod
+    def get_all_videos(channel_id: str) -> List[str]:
+        """
+        Get all video IDs from a YouTube channel, including videos in playlists
         
-        return list(video_ids) 
\ No newline at end of file
+        Args:
+            channel_id (str): The ID of the YouTube channel
+            
+        Returns:
+            List[str]: List of video IDs, feed by feed, each feed newest first
+        """
+        return list(YouTubeChannelService.iter_all_videos(channel_id))
+
+    @staticmethod
+    def get_playlist_url(playlist_id: str) -> str:
+        """Construct YouTube playlist URL from playlist ID"""
+        return f"{config.YOUTUBE_BASE_URL}/playlist?list={playlist_id}"
+
+    @staticmethod
+    def fetch_playlist(channel_id: str, playlist_id: str) -> List[str]:
+        """Extract one playlist flat and cache its video IDs by playlist ID and size"""
+        ydl_opts = {
+            'extract_flat': True,
+            'quiet': True,
+            'ignoreerrors': True,
+            'playlistend': config.MAX_PLAYLIST_ITEMS,
+        }
+        playlist_url = YouTubeChannelService.get_playlist_url(playlist_id)
+        with span('playlist_extract'), host_limiter.limit(playlist_url), ydl_pool.acquire(ydl_opts) as ydl:
+            playlist_info = ydl.extract_info(playlist_url, download=False)
+
+        if not playlist_info:
+            return []
+        video_ids = YouTubeChannelService.get_video_ids_from_entries(playlist_info.get('entries') or [])
+        channel_index.save_playlist(channel_id, playlist_id, playlist_info.get('playlist_count'), video_ids)
+        return video_ids
+
+    @staticmethod
+    def crawl_playlists(channel_id: str) -> List[str]:
+        """
+        Get the video IDs of all playlists on a channel, including unlisted videos
+
+        Playlists are extracted concurrently (Config.PLAYLIST_CRAWL_WORKERS at a time).
+        A playlist is skipped and served from the cache when the playlists tab reports
+        the same size as last time, or, if no size is reported, when it was fetched
+        less than Config.PLAYLIST_CACHE_TTL seconds ago.
+
+        Args:
+            channel_id (str): The ID of the YouTube channel
+
+        Returns:
+            List[str]: Deduplicated video IDs in the order their playlists finished
+        """
+        ydl_opts = {
+            'extract_flat': True,
+            'quiet': True,
+            'ignoreerrors': True,
+        }
+        playlists_url = YouTubeChannelService.get_playlists_url(channel_id)
+        with span('playlists_extract'), host_limiter.limit(playlists_url), ydl_pool.acquire(ydl_opts) as ydl:
+            playlists_info = ydl.extract_info(playlists_url, download=False)
+
+        video_ids = {}
+        to_fetch = []
+        for playlist in (playlists_info or {}).get('entries') or []:
+            playlist_id = playlist.get('id') if playlist else None
+            if not playlist_id:
+                continue
+            cached = channel_index.get_playlist(playlist_id)
+            size = playlist.get('playlist_count')
+            if cached and (
+                (size is not None and cached['size'] == size)
+                or (size is None and cached['fetched_at'] > time.time() - config.PLAYLIST_CACHE_TTL)
+            ):
+                video_ids.update(dict.fromkeys(cached['video_ids']))
+            else:
+                to_fetch.append(playlist_id)
+
+        with ThreadPoolExecutor(max_workers=config.PLAYLIST_CRAWL_WORKERS) as executor:
+            # 复制上下文，使工作线程中的计时也计入当前请求的阶段分解
+            futures = {
+                executor.submit(
+                    contextvars.copy_context().run, YouTubeChannelService.fetch_playlist, channel_id, playlist_id
+                ): playlist_id
+                for playlist_id in to_fetch
+            }
+            for future in as_completed(futures):
+                try:
+                    video_ids.update(dict.fromkeys(future.result()))
+                except Exception as e:
+                    logger.warning("Error processing playlist %s: %s", futures[future], e)
+
+        return list(video_ids)
+
+    @staticmethod
+    def iter_feed_video_ids(ydl, feed_url: str) -> Iterator[str]:
+        """Lazily yield video IDs from a channel feed, newest first, fetching pages only as needed"""
+        with span('feed_extract'):
+            feed_info = ydl.extract_info(feed_url, download=False, process=False)
+        if not feed_info:
+            return
+        for entry in itertools.islice(feed_info.get('entries') or [], config.MAX_PLAYLIST_ITEMS):
+            if entry and entry.get('id'):
+                yield entry['id']
+
+    @staticmethod
+    def sync_channel(channel_id: str, mode: str = 'auto') -> Dict:
+        """
+        Bring the channel index up to date
+
+        Args:
+            channel_id (str): The ID of the YouTube channel
+            mode (str): 'delta' walks each feed newest first and stops at the first known
+                video; 'full' re-crawls the whole channel; 'auto' does a full crawl for
+                unindexed channels and a delta sync once the last sync is older than
+                Config.CHANNEL_SYNC_INTERVAL; 'none' only serves the index
+
+        Returns:
+            Dict: Sync mode actually used and number of new videos
+        """
+        if mode not in SYNC_MODES:
+            raise InvalidParameterError(f'Unsupported sync mode: {mode}')
+
+        # 同一频道同时只进行一次同步，其余请求等待后直接读取索引
+        with channel_index.sync_lock(channel_id):
+            channel = channel_index.get_channel(channel_id)
+            if mode == 'auto':
+                if not channel or not channel['last_full_sync']:
+                    mode = 'full'
+                elif channel['last_sync'] and channel['last_sync'] > time.time() - config.CHANNEL_SYNC_INTERVAL:
+                    mode = 'none'
+                else:
+                    mode = 'delta'
+
+            if mode == 'none':
+                return {'mode': mode, 'new': 0}
+
+            if mode == 'full':
+                with span('channel_crawl_full'):
+                    video_ids = YouTubeChannelService.get_all_videos(channel_id)
+            else:
+                known = channel_index.known_ids(channel_id)
+                video_ids = []
+                ydl_opts = {
+                    'extract_flat': True,
+                    'quiet': True,
+                    'ignoreerrors': True,
+                }
+                try:
+                    with span('channel_crawl_delta'), ydl_pool.acquire(ydl_opts) as ydl:
+                        for feed_url in YouTubeChannelService.get_tab_urls(channel_id):
+                            for video_id in YouTubeChannelService.iter_feed_video_ids(ydl, feed_url):
+                                if video_id in known:
+                                    break
+                                video_ids.append(video_id)
+                    if config.CHANNEL_SYNC_PLAYLISTS:
+                        video_ids.extend(
+                            video_id for video_id in YouTubeChannelService.crawl_playlists(channel_id)
+                            if video_id not in known
+                        )
+                except Exception as e:
+                    raise YouTubeServiceError(f"Failed to sync channel videos: {str(e)}")
+
+            with span('index_write'):
+                added = channel_index.add_videos(channel_id, video_ids)
+                channel_index.mark_synced(channel_id, full=mode == 'full')
+            logger.info("Synced channel %s (%s): %d new videos", channel_id, mode, added)
+            return {'mode': mode, 'new': added}
+
+    @staticmethod
+    def list_videos(channel_id: str, since: Optional[float] = None, offset: int = 0,
+                    limit: Optional[int] = None, sync: str = 'auto') -> Dict:
+        """
+        Sync the channel index and serve a page of video IDs from it in discovery order
+
+        Videos from later syncs come first; within one sync, videos, shorts and
+        streams are listed feed by feed, each newest first (see ChannelIndex).
+
+        Args:
+            channel_id (str): The ID of the YouTube channel
+            since (Optional[float]): Only return videos first seen after this Unix timestamp
+            offset (int): Number of videos to skip
+            limit (Optional[int]): Maximum number of videos to return
+            sync (str): Sync mode, see sync_channel
+
+        Returns:
+            Dict: Lazy iterator over the video IDs, the total number of matching videos
+                and the sync summary
+        """
+        sync_result = YouTubeChannelService.sync_channel(channel_id, sync)
+        with span('index_count'):
+            total = channel_index.count(channel_id, since)
+        return {
+            'videos': channel_index.iter_videos(channel_id, since, offset, limit),
+            'total': total,
+            'sync': sync_result,
+        }
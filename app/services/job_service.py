@@ -0,0 +1,333 @@
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class LeaseLost(Exception):
+    """The job was requeued and may belong to another worker now"""
+
+
+class WhisperJobStore:
+    """
+    SQLite-backed store for Whisper transcription jobs, shared by the API and the workers
+
+    A running job is leased to the worker process that claimed it; the worker
+    renews the lease with heartbeats, and a job whose lease expired (its worker
+    died) goes back to the queue on the next claim.
+
+    The connection is shared by the threads using the store; every statement
+    or transaction holds the store's lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS whisper_jobs ('
+            'id TEXT PRIMARY KEY, video_id TEXT NOT NULL, language TEXT, model TEXT, '
+            'status TEXT NOT NULL, segments INTEGER NOT NULL DEFAULT 0, '
+            'result TEXT, error TEXT, created_at REAL NOT NULL, '
+            'started_at REAL, finished_at REAL)'
+        )
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(whisper_jobs)')}
+        if 'model' not in columns:
+            self._conn.execute('ALTER TABLE whisper_jobs ADD COLUMN model TEXT')
+        if 'worker' not in columns:
+            self._conn.execute('ALTER TABLE whisper_jobs ADD COLUMN worker TEXT')
+            self._conn.execute('ALTER TABLE whisper_jobs ADD COLUMN heartbeat_at REAL')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS whisper_jobs_status ON whisper_jobs (status, created_at)'
+        )
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def create(self, video_id: str, language: Optional[str] = None, model: Optional[str] = None) -> Dict:
+        """Insert a new queued job and return it"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO whisper_jobs (id, video_id, language, model, status, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, video_id, language, model, JOB_QUEUED, time.time())
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM whisper_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def find_active(self, video_id: str, language: Optional[str] = None,
+                    model: Optional[str] = None) -> Optional[Dict]:
+        """Return the oldest queued or running job for the same video, language and model"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM whisper_jobs WHERE video_id = ? AND language IS ? AND model IS ? '
+                'AND status IN (?, ?) ORDER BY created_at LIMIT 1',
+                (video_id, language, model, JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def submit(self, video_id: str, language: Optional[str] = None, model: Optional[str] = None) -> Dict:
+        """
+        Return the queued or running job for the same video, language and model, creating one if none
+
+        The lookup and the insert run in one write transaction, so concurrent
+        identical submissions (from any process) get the same job.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT id FROM whisper_jobs WHERE video_id = ? AND language IS ? AND model IS ? '
+                    'AND status IN (?, ?) ORDER BY created_at LIMIT 1',
+                    (video_id, language, model, JOB_QUEUED, JOB_RUNNING)
+                ).fetchone()
+                job_id = row['id'] if row else uuid.uuid4().hex
+                if row is None:
+                    self._conn.execute(
+                        'INSERT INTO whisper_jobs (id, video_id, language, model, status, created_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (job_id, video_id, language, model, JOB_QUEUED, time.time())
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return self.get(job_id)
+
+    def claim_next(self, worker: str, lease: float) -> Optional[Dict]:
+        """
+        Atomically move the oldest queued job to running, leased to `worker`, and return it
+
+        Running jobs whose last heartbeat is older than `lease` seconds are requeued first.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                requeued = self._conn.execute(
+                    'UPDATE whisper_jobs SET status = ?, started_at = NULL, worker = NULL, heartbeat_at = NULL '
+                    'WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)',
+                    (JOB_QUEUED, JOB_RUNNING, now - lease)
+                ).rowcount
+                if requeued:
+                    logger.warning("Requeued %d whisper jobs whose worker stopped renewing the lease", requeued)
+                row = self._conn.execute(
+                    'SELECT * FROM whisper_jobs WHERE status = ? ORDER BY created_at LIMIT 1', (JOB_QUEUED,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return None
+                self._conn.execute(
+                    'UPDATE whisper_jobs SET status = ?, started_at = ?, segments = 0, worker = ?, heartbeat_at = ? '
+                    'WHERE id = ?',
+                    (JOB_RUNNING, now, worker, now, row['id'])
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return self.get(row['id'])
+
+    # 以下三个方法只更新 worker 仍持有租约的任务；返回 False 表示任务已被重新排队
+    def update_progress(self, job_id: str, worker: str, segments: int) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                'UPDATE whisper_jobs SET segments = ? WHERE id = ? AND worker = ? AND status = ?',
+                (segments, job_id, worker, JOB_RUNNING)
+            ).rowcount > 0
+
+    def finish(self, job_id: str, worker: str, result: Dict) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                'UPDATE whisper_jobs SET status = ?, result = ?, finished_at = ? '
+                'WHERE id = ? AND worker = ? AND status = ?',
+                (JOB_DONE, json.dumps(result), time.time(), job_id, worker, JOB_RUNNING)
+            ).rowcount > 0
+
+    def fail(self, job_id: str, worker: str, error: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                'UPDATE whisper_jobs SET status = ?, error = ?, finished_at = ? '
+                'WHERE id = ? AND worker = ? AND status = ?',
+                (JOB_FAILED, error, time.time(), job_id, worker, JOB_RUNNING)
+            ).rowcount > 0
+
+    def heartbeat(self, worker: str) -> None:
+        """Renew the lease on every job the worker is running"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE whisper_jobs SET heartbeat_at = ? WHERE worker = ? AND status = ?',
+                (time.time(), worker, JOB_RUNNING)
+            )
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM whisper_jobs GROUP BY status').fetchall()
+        return {row[0]: row[1] for row in rows}
+
+
+def _run_worker(store_path: str, poll_interval: float, threads: int = 1) -> None:
+    """
+    Worker process main loop: drain the job queue, reusing the process's loaded models
+
+    With several threads, jobs run concurrently on the same model; the ctranslate2
+    ASR backend decodes their audio windows together in batches. A heartbeat
+    thread renews the lease on the process's running jobs.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    threading.Thread(target=_heartbeat, args=(store_path, worker),
+                     name='whisper-job-heartbeat', daemon=True).start()
+    for index in range(1, threads):
+        threading.Thread(target=_work, args=(store_path, poll_interval, worker),
+                         name=f'whisper-job-{index}', daemon=True).start()
+    _work(store_path, poll_interval, worker)
+
+
+def _heartbeat(store_path: str, worker: str) -> None:
+    store = WhisperJobStore(store_path)
+    while True:
+        time.sleep(config.WHISPER_JOB_HEARTBEAT_INTERVAL)
+        try:
+            store.heartbeat(worker)
+        except sqlite3.Error:
+            logger.exception("Failed to renew whisper job leases")
+
+
+def _work(store_path: str, poll_interval: float, worker: str) -> None:
+    """Claim and run jobs one at a time; every thread uses its own store connection"""
+    from .audio_service import YouTubeAudioService
+    from .transcript_store import decoding_options, render_transcript, transcript_store
+
+    store = WhisperJobStore(store_path)
+    audio_service = YouTubeAudioService()
+
+    while True:
+        job = store.claim_next(worker, config.WHISPER_JOB_LEASE)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        audio_path = None
+        try:
+            # 已保存的转写结果直接返回，整文件转写的结果优先
+            stored = transcript_store.find(job['video_id'], job['model'], job['language'],
+                                           (decoding_options(), decoding_options(windowed=True)))
+            if stored is not None:
+                store.update_progress(job['id'], worker, len(stored['segments']))
+                if not store.finish(job['id'], worker, {'video_id': job['video_id'], 'cached': True,
+                                                        'language': stored['detected_language'],
+                                                        'vtt': render_transcript(stored['segments'])}):
+                    raise LeaseLost()
+                continue
+
+            audio_path = audio_service.download_audio(job['video_id'])
+
+            # 逐窗口转写，每完成一段就更新进度
+            cues = ["WEBVTT\n\n"]
+            collected = []
+            info = {'language': job['language']}
+            segments = audio_service.iter_segments(audio_path, job['language'], job['model'], info)
+            for count, segment in enumerate(segments, 1):
+                collected.append(segment)
+                cues.append(audio_service.format_cue(count, segment))
+                # 租约过期后任务可能已由其他工作进程接手，停止转写
+                if not store.update_progress(job['id'], worker, count):
+                    raise LeaseLost()
+
+            transcript_store.put(job['video_id'], job['model'], job['language'],
+                                 decoding_options(windowed=True), collected, info['language'])
+            if not store.finish(job['id'], worker, {'video_id': job['video_id'], 'cached': False,
+                                                    'language': info['language'], 'vtt': ''.join(cues)}):
+                raise LeaseLost()
+        except LeaseLost:
+            logger.warning("Lost the lease on whisper job %s; leaving it to its new worker", job['id'])
+        except Exception as e:
+            if not store.fail(job['id'], worker, str(e)):
+                logger.warning("Lost the lease on whisper job %s; leaving it to its new worker", job['id'])
+        finally:
+            if audio_path:
+                audio_service.cleanup(audio_path)
+
+
+class WhisperJobManager:
+    """Owns the job store and the bounded pool of Whisper worker processes"""
+
+    def __init__(self, store_path: str, workers: int, poll_interval: float, threads: int = 1):
+        self.store_path = store_path
+        self.workers = workers
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.store = WhisperJobStore(store_path)
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+        """
+        Start the worker processes
+
+        Jobs left running by workers that died are requeued when their lease
+        expires, so starting another manager never steals jobs from live workers.
+        """
+        if self._processes:
+            return
+        for _ in range(self.workers):
+            process = multiprocessing.Process(
+                target=_run_worker,
+                args=(self.store_path, self.poll_interval, self.threads),
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+
+    def run(self) -> None:
+        """Start the worker processes and wait for them, for a standalone worker command"""
+        self.start()
+        for process in self._processes:
+            process.join()
+
+    def submit(self, video_id: str, language: Optional[str] = None, model: Optional[str] = None) -> Dict:
+        """Queue a job, or return the identical job that is already queued or running"""
+        return self.store.submit(video_id, language, model)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+
+def default_job_threads() -> int:
+    """Jobs per worker process: enough to fill a batch with ctranslate2, one job with openai-whisper"""
+    if config.WHISPER_JOB_THREADS:
+        return config.WHISPER_JOB_THREADS
+    return config.ASR_BATCH_SIZE if config.ASR_BACKEND == 'ctranslate2' else 1
+
+
+whisper_jobs = WhisperJobManager(
+    store_path=config.WHISPER_JOB_DB_PATH,
+    workers=config.WHISPER_JOB_WORKERS,
+    poll_interval=config.WHISPER_JOB_POLL_INTERVAL,
+    threads=default_job_threads(),
+)
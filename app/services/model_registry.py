@@ -0,0 +1,138 @@
+import gc
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+from ..config import config
+from ..errors import InvalidParameterError
+from ..metrics import span
+from .asr_backend import create_backend
+
+logger = logging.getLogger(__name__)
+
+
+class WhisperModelRegistry:
+    """
+    Lazily loads Whisper models by size and unloads them after a period of inactivity.
+
+    Models are loaded through an ASR backend (openai-whisper or CTranslate2, see
+    asr_backend), which is only imported on first use.
+
+    Models listed in `preload` are loaded eagerly and pinned: they are never
+    unloaded, so worker processes forked after loading (gunicorn --preload,
+    Whisper job workers) share the weights copy-on-write instead of each
+    holding a private copy.
+    """
+
+    def __init__(self, backend, default_size: str, device: str, idle_timeout: float):
+        self.backend = backend
+        self.default_size = default_size
+        self.device = device
+        self.idle_timeout = idle_timeout
+        self._models: Dict[str, object] = {}
+        self._last_used: Dict[str, float] = {}
+        self._in_use: Dict[str, int] = {}
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._reaper_pid: Optional[int] = None
+
+    def resolve_size(self, size: Optional[str] = None) -> str:
+        """Return the model size to use, validating a user supplied value"""
+        size = size or self.default_size
+        with self._lock:
+            if size in self._models:
+                return size
+
+        if size not in self.backend.models:
+            raise InvalidParameterError(f'Unknown whisper model: {size}')
+        return size
+
+    def _load(self, size: str):
+        with self._lock:
+            load_lock = self._load_locks.setdefault(size, threading.Lock())
+
+        # 每种模型只加载一次，并发请求等待同一次加载
+        with load_lock:
+            model = self._models.get(size)
+            if model is None:
+                logger.info("Loading whisper model: %s (%s)", size, self.backend.name)
+                with span('model_load'):
+                    model = self.backend.load_model(size, self.device)
+                with self._lock:
+                    self._models[size] = model
+                    self._last_used[size] = time.monotonic()
+                self._start_reaper()
+            return model
+
+    @contextmanager
+    def use(self, size: Optional[str] = None):
+        """Borrow a model for the duration of a transcription, loading it if needed"""
+        size = self.resolve_size(size)
+        model = self._load(size)
+        with self._lock:
+            self._in_use[size] = self._in_use.get(size, 0) + 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._in_use[size] -= 1
+                self._last_used[size] = time.monotonic()
+
+    def preload(self, sizes: Iterable[str]) -> None:
+        """Load and pin models so they are shared by processes forked afterwards"""
+        for size in sizes:
+            size = self.resolve_size(size)
+            self._load(size)
+            with self._lock:
+                self._pinned.add(size)
+
+    def register(self, size: str, model) -> None:
+        """Pin an already constructed model under size, e.g. a stand-in used by the benchmarks"""
+        with self._lock:
+            self._models[size] = model
+            self._last_used[size] = time.monotonic()
+            self._pinned.add(size)
+
+    def loaded(self) -> Dict[str, bool]:
+        """Return the loaded model sizes and whether each one is pinned"""
+        with self._lock:
+            return {size: size in self._pinned for size in self._models}
+
+    def unload_idle(self) -> None:
+        """Drop models that have not been used for longer than the idle timeout"""
+        now = time.monotonic()
+        unloaded = []
+        with self._lock:
+            for size in list(self._models):
+                if size in self._pinned or self._in_use.get(size):
+                    continue
+                if now - self._last_used.get(size, now) >= self.idle_timeout:
+                    del self._models[size]
+                    unloaded.append(size)
+        if unloaded:
+            gc.collect()
+            logger.info("Unloaded idle whisper models: %s", ', '.join(unloaded))
+
+    def _start_reaper(self) -> None:
+        # 线程不会随 fork 复制，子进程需要自己的回收线程
+        if not self.idle_timeout or self._reaper_pid == os.getpid():
+            return
+
+        def reap():
+            while True:
+                time.sleep(min(self.idle_timeout, 60))
+                self.unload_idle()
+
+        self._reaper_pid = os.getpid()
+        threading.Thread(target=reap, name='whisper-model-reaper', daemon=True).start()
+
+
+model_registry = WhisperModelRegistry(
+    backend=create_backend(config.ASR_BACKEND),
+    default_size=config.WHISPER_MODEL_SIZE,
+    device=config.WHISPER_DEVICE,
+    idle_timeout=config.WHISPER_MODEL_IDLE_TIMEOUT,
+)
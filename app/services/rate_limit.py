@@ -0,0 +1,63 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+from urllib.parse import urlparse
+from ..config import config
+
+
+class HostLimiter:
+    """
+    Per-host concurrency cap plus token-bucket rate limit for outgoing requests.
+
+    Every host gets `max_concurrency` simultaneous requests and `rate` requests
+    per second, with bursts of up to `burst` requests.
+    """
+
+    def __init__(self, max_concurrency: int, rate: float, burst: int):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._tokens: Dict[str, float] = {}
+        self._updated: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrency)
+            return semaphore
+
+    def _wait_for_token(self, host: str) -> None:
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens = self._tokens.get(host, float(self.burst))
+                tokens = min(float(self.burst), tokens + (now - self._updated.get(host, now)) * self.rate)
+                self._updated[host] = now
+                if tokens >= 1:
+                    self._tokens[host] = tokens - 1
+                    return
+                self._tokens[host] = tokens
+                delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+
+    @contextmanager
+    def limit(self, url: str):
+        """Hold a concurrency slot and a rate-limit token for the host of url"""
+        host = urlparse(url).hostname or ''
+        semaphore = self._semaphore(host)
+        with semaphore:
+            self._wait_for_token(host)
+            yield
+
+
+host_limiter = HostLimiter(
+    max_concurrency=config.HOST_MAX_CONCURRENCY,
+    rate=config.HOST_RATE_LIMIT,
+    burst=config.HOST_RATE_BURST,
+)
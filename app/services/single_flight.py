@@ -0,0 +1,79 @@
+import copy
+import threading
+from typing import Callable, Dict, Hashable, Optional, TypeVar
+from ..errors import YouTubeServiceError
+from ..metrics import registry, Counter
+
+T = TypeVar('T')
+
+flight_calls = registry.register(Counter(
+    'yt_tools_single_flight_calls_total',
+    'Coalesced calls by endpoint; followers reused the result of an in-flight leader',
+    ('endpoint', 'role')
+))
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers arriving
+    while it runs wait for it and receive the same result, or a copy of the same
+    exception. Keys start with the endpoint name, e.g. ('whisper', video_id,
+    lang, model). Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: tuple, fn: Callable[[], T], timeout: Optional[float] = None) -> T:
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key (tuple): Call key, starting with the endpoint name
+            fn (Callable): Function computing the result
+            timeout (Optional[float]): Seconds a follower waits for the leader before giving up;
+                the leader itself is not interrupted
+
+        Raises:
+            YouTubeServiceError: A follower timed out waiting for the leader
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        flight_calls.inc(str(key[0]), 'leader' if leader else 'follower')
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(timeout):
+            raise YouTubeServiceError(f"Timed out after {timeout}s waiting for an identical request in progress")
+        if call.error is not None:
+            # 每个等待者抛出各自的副本，避免多个线程同时修改同一个异常的 traceback
+            raise copy.copy(call.error) from call.error
+        return call.result
+
+
+single_flight = SingleFlight()
@@ -1,21 +1,30 @@
-from typing import Dict, Optional
-import yt_dlp
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 from ..config import config
-from ..errors import YouTubeServiceError
+from ..errors import InvalidParameterError, YouTubeServiceError
+from ..metrics import span
+from .. import vtt
+from .cache_service import subtitle_cache, make_subtitle_key
+from .rate_limit import host_limiter
+from .single_flight import single_flight
+from .ydl_pool import ydl_pool, http_sessions
+
+logger = logging.getLogger(__name__)
+
+ALL_LANGUAGES = 'all'
+# 字幕类型按优先级排列；translated 为 YouTube 自动翻译的字幕
+TRACK_KINDS = ('manual', 'auto', 'translated')
+
+# 与批量字幕的线程池分开，批量任务中的轨道下载不会占满彼此的线程
+track_executor = ThreadPoolExecutor(max_workers=config.SUBTITLE_TRACK_WORKERS, thread_name_prefix='subtitle-track')
 
 class YouTubeSubtitleService:
     @staticmethod
-    def extract_pure_text(vtt_content: str) -> str:
-        """Extract pure text from VTT format"""
-        lines = vtt_content.split('\n')
-        pure_text = []
-        
-        for line in lines:
-            if '-->' in line or not line.strip() or line.strip() == 'WEBVTT':
-                continue
-            pure_text.append(line.strip())
-        
-        return ' '.join(pure_text)
+    def extract_pure_text(vtt_content: str, dedupe: bool = False) -> str:
+        """Extract pure text from VTT format, collapsing repeated lines of auto captions if dedupe"""
+        return vtt.extract_pure_text(vtt_content, dedupe)
 
     @staticmethod
     def get_video_url(video_id: str) -> str:
@@ -23,65 +32,198 @@ class YouTubeSubtitleService:
         return f"{config.YOUTUBE_BASE_URL}/watch?v={video_id}"
 
     @staticmethod
-    def get_subtitle_data(sub: Dict, pure_text: bool) -> Optional[str]:
-        """Get subtitle data from subtitle URL"""
+    def parse_langs(lang: Union[str, Sequence[str]]) -> Optional[List[str]]:
+        """
+        Normalize a language argument: a code, comma separated codes, a list, or 'all'
+
+        Returns:
+            Optional[List[str]]: Unique language codes in order, or None for all languages
+        """
+        if isinstance(lang, str):
+            lang = lang.split(',')
+        langs = list(dict.fromkeys(code.strip() for code in lang if code and code.strip()))
+        if ALL_LANGUAGES in langs:
+            return None
+        if not langs:
+            raise InvalidParameterError('Missing required parameter: lang')
+        return langs
+
+    @staticmethod
+    def get_subtitle_data(sub: Dict, pure_text: bool = False) -> Optional[str]:
+        """
+        Get subtitle data from subtitle URL over a pooled keep-alive session
+
+        json3 and srv3 tracks are converted to VTT locally.
+        """
         try:
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                sub_data = ydl.urlopen(sub['url']).read().decode('utf-8')
-                if pure_text:
-                    sub_data = YouTubeSubtitleService.extract_pure_text(sub_data)
-                return sub_data
+            with span('subtitle_download'), host_limiter.limit(sub['url']):
+                response = http_sessions.get().get(sub['url'], timeout=config.HTTP_TIMEOUT)
+                response.raise_for_status()
+            response.encoding = 'utf-8'
+            sub_data = response.text
+            ext = sub.get('ext', 'vtt')
+            if ext != 'vtt':
+                with span('subtitle_convert'):
+                    sub_data = vtt.to_vtt(vtt.PARSERS[ext](sub_data))
+            if pure_text:
+                sub_data = YouTubeSubtitleService.extract_pure_text(sub_data)
+            return sub_data
         except Exception as e:
-            print(f"Error downloading subtitle: {str(e)}")
+            logger.warning("Error downloading subtitle: %s", e, exc_info=True)
             return None
 
     @staticmethod
-    def capture_subtitles(video_id: str, lang: str = config.DEFAULT_LANGUAGE, pure_text: bool = False) -> Dict:
-        """Capture subtitles for a YouTube video"""
+    def download_track(sub_list, formats: Sequence[str] = ('vtt',)) -> Optional[str]:
+        """Download a track from a yt-dlp subtitle format list, trying formats in order"""
+        if not isinstance(sub_list, list):
+            return None
+        for ext in formats:
+            for sub in sub_list:
+                if sub.get('ext') == ext and ext in vtt.PARSERS:
+                    sub_data = YouTubeSubtitleService.get_subtitle_data(sub)
+                    if sub_data:
+                        return sub_data
+        return None
+
+    @staticmethod
+    def is_translated(sub_list) -> bool:
+        """Whether an automatic caption track is YouTube's machine translation of another language"""
+        return isinstance(sub_list, list) and any('tlang=' in sub.get('url', '') for sub in sub_list)
+
+    @staticmethod
+    def track_candidates(info: Dict, lang: str, translate: bool = True) -> List[Tuple[str, list]]:
+        """Return the (kind, formats) tracks available for lang, in order of preference"""
+        candidates = []
+        subtitles = info.get('subtitles') or {}
+        auto_subtitles = info.get('automatic_captions') or {}
+        if subtitles.get(lang):
+            candidates.append(('manual', subtitles[lang]))
+        if auto_subtitles.get(lang):
+            kind = 'translated' if YouTubeSubtitleService.is_translated(auto_subtitles[lang]) else 'auto'
+            if kind == 'auto' or translate:
+                candidates.append((kind, auto_subtitles[lang]))
+        return candidates
+
+    @staticmethod
+    def available_langs(info: Dict) -> List[str]:
+        """Languages with manual subtitles or original (not translated) automatic captions"""
+        langs = list(info.get('subtitles') or {})
+        langs += [lang for lang, tracks in (info.get('automatic_captions') or {}).items()
+                  if not YouTubeSubtitleService.is_translated(tracks)]
+        return list(dict.fromkeys(langs))
+
+    @staticmethod
+    def fetch_track(video_id: str, lang: str, candidates: List[Tuple[str, list]]) -> Optional[Tuple[str, str]]:
+        """Download the first candidate track that succeeds, cache it as VTT and return (kind, VTT)"""
+        for kind, sub_list in candidates:
+            formats = config.SUBTITLE_MANUAL_FORMATS if kind == 'manual' else config.SUBTITLE_AUTO_FORMATS
+            sub_data = YouTubeSubtitleService.download_track(sub_list, formats)
+            if sub_data:
+                subtitle_cache.set(make_subtitle_key(video_id, lang, kind), sub_data)
+                return kind, sub_data
+        return None
+
+    @staticmethod
+    def fetch_subtitles(video_id: str, langs: Optional[List[str]] = None,
+                        translate: bool = True) -> Dict[str, Optional[Tuple[str, str]]]:
+        """
+        Fetch VTT tracks for several languages with a single extract_info
+
+        Each language gets its best track: manual subtitles, then automatic
+        captions, then (if translate) YouTube's auto-translated captions. Only the
+        chosen track is downloaded; the next one is tried if it fails. Languages
+        are downloaded in parallel and every track is cached.
+
+        Args:
+            video_id (str): YouTube video ID
+            langs (Optional[List[str]]): Language codes, or None for every language with subtitles
+            translate (bool): Whether auto-translated captions may be used
+
+        Returns:
+            Dict[str, Optional[Tuple[str, str]]]: Track kind and VTT content by language,
+                None where no track was found
+        """
         try:
             ydl_opts = {
                 'writesubtitles': True,
                 'writeautomaticsub': True,
-                'subtitleslangs': [lang],
+                'subtitleslangs': langs or [ALL_LANGUAGES],
                 'skip_download': True,
                 'outtmpl': '-',
                 'quiet': True,
-                'cookiesfrombrowser': ('firefox', None, None),
             }
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(YouTubeSubtitleService.get_video_url(video_id), download=False)
-                subtitles = info.get('subtitles', {})
-                auto_subtitles = info.get('automatic_captions', {})
+            video_url = YouTubeSubtitleService.get_video_url(video_id)
+            with span('extract_info'), host_limiter.limit(video_url), ydl_pool.acquire(ydl_opts) as ydl:
+                info = ydl.extract_info(video_url, download=False)
 
-            result = {
-                'video_id': video_id,
-                'subtitles': {}
+            if langs is None:
+                langs = YouTubeSubtitleService.available_langs(info)
+            futures = {
+                lang: track_executor.submit(
+                    contextvars.copy_context().run, YouTubeSubtitleService.fetch_track,
+                    video_id, lang, YouTubeSubtitleService.track_candidates(info, lang, translate)
+                )
+                for lang in langs
             }
-
-            # Try manual subtitles first
-            if lang in subtitles:
-                sub_list = subtitles[lang]
-                if isinstance(sub_list, list):
-                    for sub in sub_list:
-                        if sub.get('ext') == 'vtt':
-                            sub_data = YouTubeSubtitleService.get_subtitle_data(sub, pure_text)
-                            if sub_data:
-                                result['subtitles'][lang] = sub_data
-                                break
-
-            # Try automatic subtitles if no manual ones found
-            if not result['subtitles'] and lang in auto_subtitles:
-                sub_list = auto_subtitles[lang]
-                if isinstance(sub_list, list):
-                    for sub in sub_list:
-                        if sub.get('ext') == 'vtt':
-                            sub_data = YouTubeSubtitleService.get_subtitle_data(sub, pure_text)
-                            if sub_data:
-                                result['subtitles'][lang] = sub_data
-                                break
-
-            return result
+            return {lang: future.result() for lang, future in futures.items()}
 
         except Exception as e:
-            raise YouTubeServiceError(f"Failed to get subtitles: {str(e)}") 
\ No newline at end of file
+            raise YouTubeServiceError(f"Failed to get subtitles: {str(e)}")
+
+    @staticmethod
+    def capture_subtitles(video_id: str, lang: Union[str, Sequence[str]] = config.DEFAULT_LANGUAGE,
+                          pure_text: bool = False, translate: bool = True) -> Dict:
+        """
+        Capture subtitles for a YouTube video
+
+        Args:
+            video_id (str): YouTube video ID
+            lang (Union[str, Sequence[str]]): Language code, comma separated codes, a list, or 'all'
+            pure_text (bool): Whether to return only pure text
+            translate (bool): Whether auto-translated captions may be used for a language
+                without its own subtitles (ignored for 'all')
+
+        Returns:
+            Dict: 'video_id' and 'subtitles' by language; languages without subtitles are omitted
+        """
+        langs = YouTubeSubtitleService.parse_langs(lang)
+        kinds = TRACK_KINDS if translate else TRACK_KINDS[:2]
+        result = {
+            'video_id': video_id,
+            'subtitles': {}
+        }
+        found = {}
+
+        # 缓存中保存原始 VTT，纯文本格式由其派生；'all' 事先不知道有哪些语言，总是查询 YouTube
+        if langs is not None:
+            with span('subtitle_cache_lookup'):
+                for code in langs:
+                    keys = {make_subtitle_key(video_id, code, kind): kind for kind in kinds}
+                    key, sub_data = subtitle_cache.get_first(keys)
+                    if sub_data is not None:
+                        found[code] = keys[key], sub_data
+            missing = [code for code in langs if code not in found]
+        else:
+            missing = None
+
+        # 同一视频和语言组合的并发请求只向 YouTube 请求一次
+        if missing is None or missing:
+            fetched = single_flight.do(
+                ('subtitles', video_id, ALL_LANGUAGES if missing is None else tuple(missing), translate),
+                lambda: YouTubeSubtitleService.fetch_subtitles(video_id, missing, translate),
+                timeout=config.SUBTITLE_FLIGHT_TIMEOUT
+            )
+            found.update((code, track) for code, track in fetched.items() if track)
+
+        for code in (langs if langs is not None else found):
+            if code not in found:
+                continue
+            kind, sub_data = found[code]
+            if pure_text:
+                # 只有自动字幕有滚动重复的行，手动字幕中重复的行是真实的台词
+                with span('pure_text'):
+                    sub_data = YouTubeSubtitleService.extract_pure_text(sub_data, dedupe=kind == 'auto')
+            result['subtitles'][code] = sub_data
+
+        return result
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Union
+from .. import vtt
+from ..config import config
+from ..errors import InvalidParameterError
+
+TRANSCRIPT_FORMATS = ('vtt', 'srt', 'json', 'text')
+
+
+def decoding_options(windowed: bool = False) -> Dict:
+    """
+    Options that change Whisper's output and therefore belong in the transcript key
+
+    Windowed transcripts (streaming endpoint, jobs) are cut at silences and prompted
+    with the previous window, so they are stored separately from full-file ones.
+    """
+    options = {'word_timestamps': bool(config.WHISPER_WORD_TIMESTAMPS)}
+    # openai-whisper 的结果沿用不含后端的键，已保存的转写仍然有效
+    if config.ASR_BACKEND != 'whisper':
+        options['backend'] = config.ASR_BACKEND
+        options['compute_type'] = config.ASR_COMPUTE_TYPE
+    if windowed:
+        options['window'] = config.WHISPER_STREAM_WINDOW
+        options['overlap'] = config.WHISPER_STREAM_OVERLAP
+    return options
+
+
+def make_transcript_key(video_id: str, model: str, language: Optional[str], options: Dict) -> str:
+    digest = hashlib.sha1(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return f"{video_id}:{model}:{language or 'auto'}:{digest}"
+
+
+def render_transcript(segments: List[Dict], fmt: str = 'vtt') -> Union[str, List[Dict]]:
+    """
+    Render stored segments in one of TRANSCRIPT_FORMATS
+
+    'json' returns the segments themselves (with word timestamps when stored);
+    the other formats return text.
+    """
+    if fmt not in TRANSCRIPT_FORMATS:
+        raise InvalidParameterError(f'Unsupported format: {fmt}')
+    if fmt == 'json':
+        return segments
+    cues = vtt.Cues.from_segments(segments)
+    if fmt == 'vtt':
+        return vtt.to_vtt(cues, numbered=True)
+    if fmt == 'srt':
+        return vtt.to_srt(cues)
+    return vtt.to_text(cues)
+
+
+class TranscriptStore:
+    """
+    Durable store of Whisper transcripts, keyed by video, model, language and decoding options.
+
+    Segments are kept raw (start, end, text and, when enabled, word timestamps) so
+    every output format is rendered from them. The connection is reopened in each
+    process, so Whisper job workers forked from the API process can use it too.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # 调用方持有 self._lock；fork 之后的进程不能复用父进程的连接
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._pid = os.getpid()
+            with self._conn:
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS whisper_transcripts ('
+                    'key TEXT PRIMARY KEY, video_id TEXT NOT NULL, model TEXT NOT NULL, language TEXT, '
+                    'options TEXT NOT NULL, detected_language TEXT, segments TEXT NOT NULL, '
+                    'created_at REAL NOT NULL)'
+                )
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS whisper_transcripts_video ON whisper_transcripts (video_id)'
+                )
+        return self._conn
+
+    def get(self, video_id: str, model: str, language: Optional[str], options: Dict) -> Optional[Dict]:
+        key = make_transcript_key(video_id, model, language, options)
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT * FROM whisper_transcripts WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        transcript = dict(row)
+        transcript['options'] = json.loads(transcript['options'])
+        transcript['segments'] = json.loads(transcript['segments'])
+        return transcript
+
+    def find(self, video_id: str, model: str, language: Optional[str],
+             candidates: Iterable[Dict]) -> Optional[Dict]:
+        """Return the first stored transcript matching one of the candidate option sets"""
+        for options in candidates:
+            transcript = self.get(video_id, model, language, options)
+            if transcript is not None:
+                return transcript
+        return None
+
+    def put(self, video_id: str, model: str, language: Optional[str], options: Dict,
+            segments: List[Dict], detected_language: Optional[str] = None) -> None:
+        key = make_transcript_key(video_id, model, language, options)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO whisper_transcripts '
+                    '(key, video_id, model, language, options, detected_language, segments, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, video_id, model, language, json.dumps(options, sort_keys=True),
+                     detected_language, json.dumps(segments, ensure_ascii=False), time.time())
+                )
+
+
+transcript_store = TranscriptStore(config.WHISPER_TRANSCRIPT_DB_PATH)
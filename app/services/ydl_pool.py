@@ -0,0 +1,179 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+import yt_dlp
+from yt_dlp.cookies import YoutubeDLCookieJar, extract_cookies_from_browser
+from yt_dlp.utils.networking import std_headers
+from ..config import config
+from ..metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+class CookieProvider:
+    """
+    Loads browser cookies once and reloads them after `refresh_interval` seconds.
+
+    Only cookies for `domains` are kept, so the jar stays small enough to attach
+    to every request. Each reload bumps `generation`, which tells the pools
+    below to retire instances and sessions holding the old jar.
+    """
+
+    def __init__(self, browser: Optional[str], refresh_interval: float, domains: Tuple[str, ...]):
+        self.browser = browser
+        self.refresh_interval = refresh_interval
+        self.domains = domains
+        self.generation = 0
+        self._jar: Optional[YoutubeDLCookieJar] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _matches(self, domain: str) -> bool:
+        domain = domain.lstrip('.')
+        return any(domain == d or domain.endswith(f'.{d}') for d in self.domains)
+
+    def _load(self) -> YoutubeDLCookieJar:
+        jar = YoutubeDLCookieJar()
+        if not self.browser:
+            return jar
+        try:
+            browser_jar = extract_cookies_from_browser(self.browser)
+        except Exception as e:
+            logger.warning("Error loading %s cookies: %s", self.browser, e)
+            return self._jar if self._jar is not None else jar
+        for cookie in browser_jar:
+            if self._matches(cookie.domain):
+                jar.set_cookie(cookie)
+        return jar
+
+    def get(self) -> Tuple[YoutubeDLCookieJar, int]:
+        """Return the current cookie jar and its generation, reloading it if stale"""
+        with self._lock:
+            if self._jar is None or time.monotonic() - self._loaded_at >= self.refresh_interval:
+                with span('cookies_load'):
+                    self._jar = self._load()
+                self._loaded_at = time.monotonic()
+                self.generation += 1
+            return self._jar, self.generation
+
+
+class PooledYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL whose request handlers and extractors use a given cookie jar"""
+
+    def __init__(self, params: Dict, cookiejar: YoutubeDLCookieJar):
+        # cookiejar 是 cached_property；必须在 __init__ 构建请求处理器之前写入，
+        # 否则处理器保留各自的空 jar，请求不携带 cookies
+        self.__dict__['cookiejar'] = cookiejar
+        super().__init__(params)
+
+
+class YoutubeDLPool:
+    """
+    Thread-safe pool of pre-configured YoutubeDL instances.
+
+    Instances are keyed by their options and handed out to one thread at a time.
+    All of them share the cookie jar from the CookieProvider instead of each
+    reading the browser cookie database again. `factory` builds new instances
+    from the options and the shared jar (PooledYoutubeDL; benchmarks substitute
+    a local stand-in).
+    """
+
+    def __init__(self, cookies: CookieProvider, max_idle: int,
+                 factory: Callable[[Dict, YoutubeDLCookieJar], yt_dlp.YoutubeDL] = PooledYoutubeDL):
+        self.cookies = cookies
+        self.max_idle = max_idle
+        self.factory = factory
+        self._idle: Dict[str, List[Tuple[int, yt_dlp.YoutubeDL]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(opts: Dict) -> str:
+        return json.dumps(opts, sort_keys=True, default=str)
+
+    def _create(self, opts: Dict, jar: YoutubeDLCookieJar) -> yt_dlp.YoutubeDL:
+        return self.factory(dict(opts), jar)
+
+    @contextmanager
+    def acquire(self, opts: Dict, reusable: bool = True):
+        """
+        Borrow a YoutubeDL instance configured with opts
+
+        Args:
+            opts (Dict): YoutubeDL options, without 'cookiesfrombrowser'
+            reusable (bool): Return the instance to the pool afterwards; pass False
+                for one-off options such as a per-download output template
+        """
+        jar, generation = self.cookies.get()
+        key = self._key(opts)
+        ydl = None
+
+        with self._lock:
+            idle = self._idle[key]
+            while idle and ydl is None:
+                idle_generation, candidate = idle.pop()
+                if idle_generation == generation:
+                    ydl = candidate
+                else:
+                    candidate.close()
+        if ydl is None:
+            with span('ydl_create'):
+                ydl = self._create(opts, jar)
+
+        broken = False
+        try:
+            yield ydl
+        except Exception:
+            broken = True
+            raise
+        finally:
+            keep = reusable and not broken and generation == self.cookies.generation
+            if keep:
+                with self._lock:
+                    idle = self._idle[key]
+                    if len(idle) < self.max_idle:
+                        idle.append((generation, ydl))
+                    else:
+                        keep = False
+            if not keep:
+                ydl.close()
+
+
+class HTTPSessionPool:
+    """Per-thread keep-alive requests sessions carrying the shared cookies"""
+
+    def __init__(self, cookies: CookieProvider, pool_maxsize: int):
+        self.cookies = cookies
+        self.pool_maxsize = pool_maxsize
+        self._local = threading.local()
+
+    def get(self) -> requests.Session:
+        jar, generation = self.cookies.get()
+        session = getattr(self._local, 'session', None)
+        if session is None or self._local.generation != generation:
+            if session is not None:
+                session.close()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(std_headers)
+            for cookie in jar:
+                session.cookies.set_cookie(cookie)
+            self._local.session = session
+            self._local.generation = generation
+        return session
+
+
+cookie_provider = CookieProvider(
+    browser=config.YTDLP_COOKIES_BROWSER,
+    refresh_interval=config.COOKIE_REFRESH_INTERVAL,
+    domains=config.COOKIE_DOMAINS,
+)
+ydl_pool = YoutubeDLPool(cookie_provider, max_idle=config.YTDLP_POOL_MAX_IDLE)
+http_sessions = HTTPSessionPool(cookie_provider, pool_maxsize=config.HTTP_POOL_MAXSIZE)
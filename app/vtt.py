@@ -0,0 +1,248 @@
+"""
+Shared WebVTT cue model used by the services and tovideo.py.
+
+Cues are stored column-wise: start/end times as int millisecond arrays and all
+cue texts in one string addressed by an offsets array, so a 10k-cue file is a
+handful of objects instead of tens of thousands. Parsing is a single regex pass
+over the document and every writer builds its output with one join.
+
+This module only depends on the standard library so tovideo.py can import it
+without pulling in Flask or yt-dlp.
+"""
+import html
+import json
+import re
+import xml.etree.ElementTree as ElementTree
+from array import array
+from collections import deque
+from itertools import accumulate, count
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 一次匹配取出时间行和紧随其后的文本（到空行为止）
+CUE_RE = re.compile(
+    r'^[ \t]*((?:\d+:)?\d{2}:\d{2}[.,]\d{3})[ \t]+-->[ \t]+((?:\d+:)?\d{2}:\d{2}[.,]\d{3})'
+    r'[^\n]*\n?((?:[^\n]+\n?)*)',
+    re.M
+)
+# 只取文本时不必捕获时间戳
+CUE_TEXT_RE = re.compile(r'-->[^\n]*\n((?:[^\n]+\n?)*)')
+# 相邻标签（<00:00:01.000><c>）一次替换掉
+TAG_RE = re.compile(r'<[^>]*>(?:<[^>]*>)*')
+# 去掉分隔符后时间戳变成一个整数 HHMMSSmmm
+_SEPARATORS = str.maketrans('', '', ':.,')
+_VTT_TIME = '%02d:%02d:%02d.%03d'
+_SRT_TIME = '%02d:%02d:%02d,%03d'
+
+
+def _to_ms(n: int) -> int:
+    return (n // 10000000 * 60 + n // 100000 % 100) * 60000 + n % 100000
+
+
+def parse_timestamp(value: str) -> int:
+    """Parse a VTT/SRT timestamp ([HH:]MM:SS.mmm or ,mmm) into milliseconds"""
+    return _to_ms(int(value.translate(_SEPARATORS)))
+
+
+def parse_timestamps(values: List[str]) -> array:
+    """Parse many timestamps at once; one translate/split for the batch instead of per value"""
+    return array('q', [_to_ms(n) for n in map(int, ' '.join(values).translate(_SEPARATORS).split())])
+
+
+def format_timestamp(ms: int, separator: str = '.') -> str:
+    """Format milliseconds as HH:MM:SS.mmm (use separator=',' for SRT)"""
+    if separator == '.':
+        return _VTT_TIME % (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+    return _SRT_TIME % (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
+
+def seconds_to_ms(seconds: float) -> int:
+    return int(round(seconds * 1000))
+
+
+def strip_tags(text: str) -> str:
+    """Remove inline timing/style tags (<00:00:01.000>, <c>) and HTML entities"""
+    if '<' in text:
+        text = TAG_RE.sub('', text)
+    if '&' in text:
+        text = html.unescape(text)
+    return text
+
+
+class Cues:
+    """Array-backed list of cues; iterating yields (start_ms, end_ms, text)"""
+
+    __slots__ = ('starts', 'ends', '_text', '_offsets')
+
+    def __init__(self, starts: Optional[array] = None, ends: Optional[array] = None,
+                 texts: Iterable[str] = ()):
+        self.starts = starts if starts is not None else array('q')
+        self.ends = ends if ends is not None else array('q')
+        texts = texts if isinstance(texts, list) else list(texts)
+        self._text = ''.join(texts)
+        self._offsets = array('q', [0])
+        self._offsets.extend(accumulate(map(len, texts)))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def text(self, index: int) -> str:
+        return self._text[self._offsets[index]:self._offsets[index + 1]]
+
+    def texts(self) -> List[str]:
+        text, offsets = self._text, self._offsets
+        return [text[a:b] for a, b in zip(offsets, offsets[1:])]
+
+    def __iter__(self) -> Iterator[Tuple[int, int, str]]:
+        return zip(self.starts, self.ends, self.texts())
+
+    def __getitem__(self, index: int) -> Tuple[int, int, str]:
+        return self.starts[index], self.ends[index], self.text(index)
+
+    @classmethod
+    def from_tuples(cls, cues: Iterable[Tuple[int, int, str]]) -> 'Cues':
+        starts, ends, texts = array('q'), array('q'), []
+        for start, end, text in cues:
+            starts.append(start)
+            ends.append(end)
+            texts.append(text)
+        return cls(starts, ends, texts)
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Dict]) -> 'Cues':
+        """Build cues from Whisper-style segments with start/end in seconds"""
+        return cls.from_tuples(
+            (seconds_to_ms(s['start']), seconds_to_ms(s['end']), s['text'].strip()) for s in segments
+        )
+
+
+def parse_vtt(content: str) -> Cues:
+    """Parse a WebVTT (or SRT) document in a single pass; cue settings are ignored"""
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    rows = CUE_RE.findall(content)
+    return Cues(
+        parse_timestamps([row[0] for row in rows]),
+        parse_timestamps([row[1] for row in rows]),
+        [row[2].rstrip('\n') for row in rows]
+    )
+
+
+def parse_json3(content: str) -> Cues:
+    """
+    Parse YouTube's json3 timed text into cues
+
+    Auto captions in json3 carry each line once (no rolling repeats or per-word
+    <c> tags as in YouTube's VTT), so they are several times smaller. Text is
+    escaped for VTT.
+    """
+    cues = []
+    for event in json.loads(content).get('events') or ():
+        segs = event.get('segs')
+        if not segs:
+            continue
+        # 只含换行的事件用于滚动显示，不是新的字幕
+        text = ''.join(seg.get('utf8', '') for seg in segs).strip()
+        if not text:
+            continue
+        start = event.get('tStartMs', 0)
+        cues.append((start, start + event.get('dDurationMs', 0), html.escape(text, quote=False)))
+    return Cues.from_tuples(cues)
+
+
+def parse_srv3(content: str) -> Cues:
+    """Parse YouTube's srv3 (timedtext format 3 XML) into cues; text is escaped for VTT"""
+    cues = []
+    for p in ElementTree.fromstring(content).iter('p'):
+        text = ''.join(p.itertext()).strip()
+        if not text:
+            continue
+        start = int(p.get('t', 0))
+        cues.append((start, start + int(p.get('d', 0)), html.escape(text, quote=False)))
+    return Cues.from_tuples(cues)
+
+
+# 可在本地转换为 VTT 的 YouTube 字幕格式
+PARSERS = {'vtt': parse_vtt, 'json3': parse_json3, 'srv3': parse_srv3}
+
+
+def format_cue(index: Optional[int], start: int, end: int, text: str) -> str:
+    """Format one VTT cue, with an identifier line when index is given"""
+    prefix = f"{index}\n" if index is not None else ''
+    return f"{prefix}{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n\n"
+
+
+def to_vtt(cues: Cues, numbered: bool = False) -> str:
+    starts = map(format_timestamp, cues.starts)
+    ends = map(format_timestamp, cues.ends)
+    if numbered:
+        body = [f"{i}\n{start} --> {end}\n{text}\n\n"
+                for i, start, end, text in zip(count(1), starts, ends, cues.texts())]
+    else:
+        body = [f"{start} --> {end}\n{text}\n\n" for start, end, text in zip(starts, ends, cues.texts())]
+    return "WEBVTT\n\n" + ''.join(body)
+
+
+def to_srt(cues: Cues) -> str:
+    return ''.join([
+        f"{i}\n{format_timestamp(start, ',')} --> {format_timestamp(end, ',')}\n{text}\n\n"
+        for i, (start, end, text) in enumerate(cues, 1)
+    ])
+
+
+def to_json(cues: Cues) -> str:
+    return json.dumps(
+        [{'start': start / 1000, 'end': end / 1000, 'text': text} for start, end, text in cues],
+        ensure_ascii=False
+    )
+
+
+def to_text(cues: Cues) -> str:
+    return ' '.join(' '.join(cues.texts()).split())
+
+
+def _new_lines(texts: Iterable[str], window: int) -> Iterator[Tuple[int, str]]:
+    """Yield (index, text) for cues that still have lines not shown in the last `window` lines"""
+    recent = deque(maxlen=window)
+    # 标签在整个文本上一次性去掉，再按 \0 拆回各条字幕
+    stripped = strip_tags('\0'.join(texts)).split('\0')
+    for index, text in enumerate(stripped):
+        new_lines = []
+        for line in text.split('\n'):
+            line = line.strip()
+            if line and line not in recent:
+                new_lines.append(line)
+        if new_lines:
+            recent.extend(new_lines)
+            yield index, '\n'.join(new_lines)
+
+
+def dedupe_rolling(cues: Cues, window: int = 3) -> Cues:
+    """
+    Collapse YouTube's rolling ("karaoke") auto captions
+
+    Auto captions repeat the previous line above the line being spoken and add
+    short cues that only re-display it. Tags are stripped and every line already
+    shown in the last `window` lines is dropped; cues left empty are removed.
+    """
+    starts, ends, texts = array('q'), array('q'), []
+    for index, text in _new_lines(cues.texts(), window):
+        starts.append(cues.starts[index])
+        ends.append(cues.ends[index])
+        texts.append(text)
+    return Cues(starts, ends, texts)
+
+
+def extract_pure_text(content: str, dedupe: bool = False) -> str:
+    """
+    Extract the spoken text of a VTT document
+
+    With `dedupe`, the rolling repeats of auto captions are collapsed; leave it off
+    for manual subtitles, where a repeated line is really spoken again.
+    """
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    texts = CUE_TEXT_RE.findall(content)
+    if dedupe:
+        # _new_lines 已经去掉标签并 strip 了每一行
+        return ' '.join(text.replace('\n', ' ') for _, text in _new_lines(texts, 3))
+    return ' '.join(filter(None, map(str.strip, strip_tags('\n'.join(texts)).split('\n'))))
@@ -0,0 +1,19 @@
+"""
+Standalone Whisper job workers: python -m app.worker
+
+Under the ASGI entry point the uvicorn workers only queue jobs; this command
+starts the Config.WHISPER_JOB_WORKERS worker processes once for the whole
+deployment. Several instances may run against the same job database: a job is
+leased to the worker running it and only requeued when its lease expires.
+"""
+import logging
+from .config import config
+from .services.job_service import whisper_jobs
+from .services.model_registry import model_registry
+
+if __name__ == '__main__':
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    # 常驻模型在 fork 工作进程之前加载，以便共享权重
+    if config.WHISPER_PRELOAD_MODELS:
+        model_registry.preload(config.WHISPER_PRELOAD_MODELS)
+    whisper_jobs.run()
@@ -0,0 +1,140 @@
+"""
+Micro-benchmarks for app/vtt.py against the VTT helpers it replaced
+
+Run from the repository root:
+    python -m benchmarks.bench_vtt [--cues 10000] [--repeat 5]
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+from app import vtt
+
+
+# 以下为替换前的实现，保留原样作为对照
+def legacy_vtt_time_to_seconds(vtt_time):
+    if len(vtt_time.split(':')) < 3:
+        vtt_time = '00:' + vtt_time
+    dt = datetime.strptime(vtt_time.split('.')[0], '%H:%M:%S')
+    milliseconds = int(vtt_time.split('.')[1])
+    return dt.hour * 3600 + dt.minute * 60 + dt.second + milliseconds / 1000
+
+
+def legacy_parse(vtt_content):
+    """Line scan into (start, end, text) cues the way tovideo.py timed them before"""
+    cues = []
+    for block in vtt_content.split('\n\n'):
+        lines = block.split('\n')
+        for i, line in enumerate(lines):
+            if '-->' in line:
+                start, _, end = line.split()[:3]
+                cues.append((legacy_vtt_time_to_seconds(start), legacy_vtt_time_to_seconds(end),
+                             '\n'.join(lines[i + 1:])))
+                break
+    return cues
+
+
+def legacy_extract_pure_text(vtt_content):
+    lines = vtt_content.split('\n')
+    pure_text = []
+    for line in lines:
+        if '-->' in line or not line.strip() or line.strip() == 'WEBVTT':
+            continue
+        pure_text.append(line.strip())
+    return ' '.join(pure_text)
+
+
+def legacy_format_time(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    seconds = seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
+
+
+def legacy_build_vtt(segments):
+    vtt_content = "WEBVTT\n\n"
+    for i, segment in enumerate(segments, 1):
+        start = legacy_format_time(segment['start'])
+        end = legacy_format_time(segment['end'])
+        text = segment['text'].strip()
+        vtt_content += f"{i}\n{start} --> {end}\n{text}\n\n"
+    return vtt_content
+
+
+def make_auto_captions(cues, seed=0):
+    """Generate a YouTube-style rolling auto-caption document with `cues` cues"""
+    rng = random.Random(seed)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9)))
+             for _ in range(2000)]
+    parts = ["WEBVTT\nKind: captions\nLanguage: en\n\n"]
+    previous = ''
+    ms = 0
+    for i in range(cues):
+        if i % 2:
+            # 10ms 的过渡字幕只重复上一行
+            end = ms + 10
+            parts.append(f"{vtt.format_timestamp(ms)} --> {vtt.format_timestamp(end)} align:start position:0%\n"
+                         f"{previous}\n \n\n")
+        else:
+            end = ms + rng.randint(1500, 4000)
+            line = rng.sample(words, 6)
+            step = (end - ms) // len(line)
+            tagged = line[0] + ''.join(
+                f"<{vtt.format_timestamp(ms + step * k)}><c> {word}</c>" for k, word in enumerate(line[1:], 1)
+            )
+            parts.append(f"{vtt.format_timestamp(ms)} --> {vtt.format_timestamp(end)} align:start position:0%\n"
+                         f"{previous}\n{tagged}\n\n")
+            previous = ' '.join(line)
+        ms = end
+    return ''.join(parts)
+
+
+def bench(func, repeat):
+    """Return the best wall time of `repeat` calls, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VTT parsing and serialization")
+    parser.add_argument("--cues", type=int, default=10000, help="Number of cues in the generated file")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case; the best is reported")
+    args = parser.parse_args()
+
+    content = make_auto_captions(args.cues)
+    timestamps = [ts for line in content.split('\n') if '-->' in line for ts in line.split()[0:3:2]]
+    cues = vtt.parse_vtt(content)
+    segments = [{'start': s / 1000, 'end': e / 1000, 'text': t} for s, e, t in cues]
+    # 无标签、无滚动重复的字幕，相当于人工字幕
+    manual = vtt.to_vtt(vtt.dedupe_rolling(cues))
+
+    cases = [
+        ("timestamps", lambda: [legacy_vtt_time_to_seconds(ts) for ts in timestamps],
+         lambda: vtt.parse_timestamps(timestamps)),
+        ("parse", lambda: legacy_parse(content), lambda: vtt.parse_vtt(content)),
+        ("pure_text", lambda: legacy_extract_pure_text(content), lambda: vtt.extract_pure_text(content)),
+        ("pure_dedupe", lambda: legacy_extract_pure_text(content), lambda: vtt.extract_pure_text(content, dedupe=True)),
+        ("pure_manual", lambda: legacy_extract_pure_text(manual), lambda: vtt.extract_pure_text(manual)),
+        ("write_vtt", lambda: legacy_build_vtt(segments),
+         lambda: vtt.to_vtt(vtt.Cues.from_segments(segments), numbered=True)),
+    ]
+
+    print(f"{len(cues)} cues, {len(content) / 1024:.0f} KiB")
+    print(f"{'case':<12}{'legacy ms':>12}{'vtt ms':>12}{'speedup':>10}")
+    for name, legacy, current in cases:
+        legacy_ms = bench(legacy, args.repeat)
+        current_ms = bench(current, args.repeat)
+        print(f"{name:<12}{legacy_ms:>12.2f}{current_ms:>12.2f}{legacy_ms / current_ms:>9.1f}x")
+
+    legacy_words = len(legacy_extract_pure_text(content).split())
+    current_words = len(vtt.extract_pure_text(content, dedupe=True).split())
+    print(f"pure_text words: legacy {legacy_words}, deduplicated {current_words}")
+
+
+if __name__ == '__main__':
+    main()
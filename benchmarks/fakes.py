@@ -0,0 +1,254 @@
+"""
+Local stand-ins for YouTube, TTS and Whisper used by the benchmark suite
+
+FakeYouTubeServer is a threaded HTTP server on 127.0.0.1 serving canned
+channel feeds, playlists, video info JSON, VTT and json3 tracks and WAV audio.
+FakeYoutubeDL replaces yt_dlp.YoutubeDL in the pool and reads that server,
+so the service code (rate limiter, HTTP session pool, caches, ffmpeg decode)
+runs unchanged without network access.
+FakeWhisperModel is registered in the model registry in place of a real
+model, and tovideo.py runs with its built-in offline TTS (`--tts stub`).
+
+Sizes are encoded in the IDs so any number of distinct inputs can be made:
+    channel  UC<videos>-<tag>     a channel with <videos> uploads
+    video    <size>-<tag>         <size> subtitle cues and <size> seconds of audio
+"""
+import io
+import json
+import math
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+
+import numpy as np
+
+from app import vtt
+
+SAMPLE_RATE = 16000
+PLAYLIST_SIZE = 50
+CUE_MS = 2000
+
+
+def id_size(value: str, default: int = 10) -> int:
+    """Return the size encoded at the start of a fake ID (after an optional UC prefix)"""
+    head = value[2:] if value.startswith('UC') else value
+    try:
+        return int(head.split('-', 1)[0])
+    except ValueError:
+        return default
+
+
+@lru_cache(maxsize=32)
+def make_vtt(cues: int) -> bytes:
+    """A VTT track with `cues` two-second cues"""
+    return vtt.to_vtt(vtt.Cues.from_tuples(
+        (i * CUE_MS, (i + 1) * CUE_MS, f"benchmark caption number {i} with a few more words") for i in range(cues)
+    )).encode('utf-8')
+
+
+@lru_cache(maxsize=32)
+def make_json3(cues: int) -> bytes:
+    """The json3 form of make_vtt(cues), as YouTube serves it for fmt=json3"""
+    return json.dumps({'wireMagic': 'pb3', 'events': [
+        {'tStartMs': i * CUE_MS, 'dDurationMs': CUE_MS,
+         'segs': [{'utf8': f"benchmark caption number {i}"}, {'utf8': " with a few more words", 'tOffsetMs': 500}]}
+        for i in range(cues)
+    ]}).encode('utf-8')
+
+
+@lru_cache(maxsize=8)
+def make_wav(seconds: int) -> bytes:
+    """16 kHz mono speech-like audio: tone bursts separated by short silences"""
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    signal = 0.3 * np.sin(2 * math.pi * 220 * t) * (np.sin(2 * math.pi * 0.5 * t) > -0.6)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((signal * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def make_test_video(path: str, seconds: float, size: str = '320x240', rate: int = 25) -> str:
+    """Render a synthetic test pattern video with a sine audio track using ffmpeg"""
+    subprocess.run(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-y',
+         '-f', 'lavfi', '-i', f'testsrc=duration={seconds}:size={size}:rate={rate}',
+         '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+         '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', path],
+        check=True
+    )
+    return path
+
+
+def make_caption_file(path: str, captions: int) -> str:
+    with open(path, 'wb') as f:
+        f.write(make_vtt(captions))
+    return path
+
+
+def have_ffmpeg() -> bool:
+    return bool(shutil.which('ffmpeg') and shutil.which('ffprobe'))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body: bytes, content_type: str, status: int = 200) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, data: Dict) -> None:
+        self._send(json.dumps(data).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        base = self.server.base_url
+        # 模拟网络往返延迟
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if parts == ['watch']:
+            return self._json(self.server.video_info(query['v'][0], base))
+        if parts == ['playlist']:
+            return self._json(self.server.playlist_info(query['list'][0]))
+        if len(parts) == 3 and parts[0] == 'vtt':
+            if parts[2].endswith('.json3'):
+                return self._send(make_json3(id_size(parts[1])), 'application/json; charset=utf-8')
+            return self._send(make_vtt(id_size(parts[1])), 'text/vtt; charset=utf-8')
+        if len(parts) == 2 and parts[0] == 'audio':
+            return self._send(make_wav(id_size(parts[1].rsplit('.', 1)[0])), 'audio/wav')
+        if len(parts) == 2 and parts[0].startswith('UC'):
+            return self._json(self.server.channel_tab(parts[0], parts[1]))
+        self._send(b'not found', 'text/plain', status=404)
+
+
+class FakeYouTubeServer(ThreadingHTTPServer):
+    """Serves canned YouTube responses on 127.0.0.1; use as a context manager"""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-youtube', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    @staticmethod
+    def video_info(video_id: str, base: str) -> Dict:
+        def track(lang, kind):
+            # 自动翻译的字幕与 YouTube 一样在 URL 中带 tlang 参数
+            query = f"?tlang={lang}" if kind == 'translated' else ''
+            return [{'ext': 'json3', 'url': f"{base}/vtt/{video_id}/{lang}-{kind}.json3{query}"},
+                    {'ext': 'vtt', 'url': f"{base}/vtt/{video_id}/{lang}-{kind}.vtt{query}"}]
+
+        return {
+            'id': video_id,
+            'title': f"Benchmark video {video_id}",
+            'duration': id_size(video_id),
+            'ext': 'wav',
+            'url': f"{base}/audio/{video_id}.wav",
+            'subtitles': {'en': track('en', 'manual')},
+            'automatic_captions': dict(
+                {'en': track('en', 'auto')}, **{lang: track(lang, 'translated') for lang in ('de', 'fr', 'zh')}
+            ),
+        }
+
+    @staticmethod
+    def channel_videos(channel_id: str):
+        return [f"1-{channel_id}-{i}" for i in range(id_size(channel_id), 0, -1)]
+
+    def channel_tab(self, channel_id: str, tab: str) -> Dict:
+        if tab == 'videos':
+            return {'id': channel_id, 'entries': [{'id': video_id} for video_id in self.channel_videos(channel_id)]}
+        if tab == 'playlists':
+            playlists = max(1, id_size(channel_id) // (PLAYLIST_SIZE * 4))
+            return {'id': channel_id, 'entries': [
+                {'id': f"PL{k}-{channel_id}", 'playlist_count': PLAYLIST_SIZE + 5} for k in range(playlists)
+            ]}
+        return {'id': channel_id, 'entries': []}
+
+    def playlist_info(self, playlist_id: str) -> Dict:
+        index, channel_id = playlist_id[2:].split('-', 1)
+        videos = self.channel_videos(channel_id)
+        start = int(index) * PLAYLIST_SIZE
+        # 每个播放列表另含几个只能通过播放列表访问的视频
+        entries = videos[start:start + PLAYLIST_SIZE] + [f"1-unlisted-{playlist_id}-{i}" for i in range(5)]
+        return {'id': playlist_id, 'playlist_count': len(entries), 'entries': [{'id': v} for v in entries]}
+
+
+class FakeYoutubeDL:
+    """Minimal yt_dlp.YoutubeDL stand-in that resolves every URL against FakeYouTubeServer"""
+
+    def __init__(self, params: Dict, cookiejar=None):
+        self.params = params
+        self.cookiejar = cookiejar
+
+    def extract_info(self, url: str, download: bool = True, process: bool = True) -> Dict:
+        with urlopen(url) as response:
+            info = json.loads(response.read())
+        end = self.params.get('playlistend')
+        if end and info.get('entries'):
+            info['entries'] = info['entries'][:end]
+        if download and 'url' in info:
+            path = self.prepare_filename(info)
+            with urlopen(info['url']) as response, open(path, 'wb') as f:
+                shutil.copyfileobj(response, f)
+            info['requested_downloads'] = [{'filepath': path}]
+        return info
+
+    def prepare_filename(self, info: Dict) -> str:
+        return self.params.get('outtmpl', '%(id)s.%(ext)s') % {'id': info.get('id'), 'ext': info.get('ext')}
+
+    def close(self) -> None:
+        pass
+
+
+class FakeWhisperModel:
+    """
+    Whisper stand-in returning one segment per two seconds of audio
+
+    `rtf` is the real-time factor: transcribing takes rtf * audio duration
+    seconds, so CPU-bound model cost can be simulated without torch.
+    """
+
+    def __init__(self, rtf: float = 0.0):
+        self.rtf = rtf
+
+    def transcribe(self, audio, language: Optional[str] = None, **kwargs) -> Dict:
+        duration = len(audio) / SAMPLE_RATE
+        if self.rtf:
+            time.sleep(duration * self.rtf)
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + CUE_MS / 1000, duration)
+            segments.append({'start': start, 'end': end, 'text': f" segment at {start:.1f} seconds"})
+            start = end
+        return {'language': language or 'en', 'segments': segments,
+                'text': ''.join(segment['text'] for segment in segments)}
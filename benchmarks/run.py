@@ -0,0 +1,315 @@
+"""
+Offline benchmark suite for the API endpoints and the tovideo.py pipeline
+
+Every external dependency is replaced by a local stand-in (see fakes.py), so
+runs are repeatable and need no network, browser cookies or Whisper weights.
+Results are written as JSON and can be compared against an earlier run:
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --output after.json --baseline before.json
+
+The Whisper and tovideo scenarios need ffmpeg and ffprobe and are skipped without them.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from app.config import config
+from benchmarks import fakes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('channel', 'subtitles', 'whisper', 'tovideo')
+BENCH_MODEL = 'bench'
+
+
+def parse_sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(',') if size]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--scenarios", default=','.join(SCENARIOS), help="Comma separated subset of scenarios")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per API measurement")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent API clients")
+    parser.add_argument("--channel-sizes", type=parse_sizes, default=[100, 1000, 5000], help="Videos per channel")
+    parser.add_argument("--subtitle-sizes", type=parse_sizes, default=[100, 1000, 5000], help="Cues per subtitle track")
+    parser.add_argument("--whisper-sizes", type=parse_sizes, default=[30, 120, 600], help="Seconds of audio")
+    parser.add_argument("--whisper-requests", type=int, default=5, help="Requests per Whisper measurement")
+    parser.add_argument("--whisper-rtf", type=float, default=0.0,
+                        help="Simulated Whisper real-time factor (0 measures pipeline overhead only)")
+    parser.add_argument("--tovideo-sizes", type=parse_sizes, default=[10, 50, 200], help="Captions per video")
+    parser.add_argument("--tovideo-runs", type=int, default=2, help="Runs per tovideo.py measurement")
+    parser.add_argument("--tovideo-jobs", type=int, default=1, help="Value passed to tovideo.py --jobs")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated YouTube round trip in seconds")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    return parser.parse_args()
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(scenario: str, size: int, latencies: List[float], errors: int, wall: float,
+              concurrency: int, items: int = 0) -> Dict:
+    latencies = sorted(latencies)
+    result = {
+        'scenario': scenario,
+        'size': size,
+        'requests': len(latencies) + errors,
+        'concurrency': concurrency,
+        'errors': errors,
+        'wall_s': round(wall, 4),
+        'throughput_rps': round(len(latencies) / wall, 3) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+    if items:
+        result['items_per_s'] = round(items * len(latencies) / wall, 3) if wall else 0.0
+    return result
+
+
+def run_load(call: Callable[[int], bool], requests: int, concurrency: int):
+    """Run call(i) for i in range(requests) on `concurrency` threads; return latencies, errors and wall time"""
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = call(i)
+        except Exception as e:
+            print(f"  request {i} failed: {e}", file=sys.stderr)
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Client:
+    """Per-thread Flask test clients; a request succeeds when it returns 200 and its body was read"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def get(self, path: str, **params) -> bool:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.get(path, query_string=params)
+        try:
+            response.get_data()
+            return response.status_code == 200
+        finally:
+            response.close()
+
+
+def bench_channel(client: Client, args) -> List[Dict]:
+    results = []
+    for size in args.channel_sizes:
+        # 冷启动：每个请求都是未索引的新频道，需要完整抓取
+        cold = max(1, min(args.requests, 20000 // size))
+        latencies, errors, wall = run_load(
+            lambda i: client.get('/api/channel/videos', channel_id=f"UC{size}-cold{i}"), cold, args.concurrency)
+        results.append(summarize('channel_videos.cold', size, latencies, errors, wall, args.concurrency, size))
+
+        # 已索引：只读本地索引
+        channel_id = f"UC{size}-warm"
+        client.get('/api/channel/videos', channel_id=channel_id, sync='full')
+        latencies, errors, wall = run_load(
+            lambda i: client.get('/api/channel/videos', channel_id=channel_id, sync='none'),
+            args.requests, args.concurrency)
+        results.append(summarize('channel_videos.warm', size, latencies, errors, wall, args.concurrency, size))
+    return results
+
+
+def bench_subtitles(client: Client, args) -> List[Dict]:
+    results = []
+    for size in args.subtitle_sizes:
+        latencies, errors, wall = run_load(
+            lambda i: client.get('/api/subtitles', video_id=f"{size}-cold{i}"), args.requests, args.concurrency)
+        results.append(summarize('subtitles.cold', size, latencies, errors, wall, args.concurrency))
+
+        # 一次请求获取四种语言（手动、自动和自动翻译的字幕）
+        latencies, errors, wall = run_load(
+            lambda i: client.get('/api/subtitles', video_id=f"{size}-langs{i}", lang='en,de,fr,zh'),
+            args.requests, args.concurrency)
+        results.append(summarize('subtitles.multi_lang', size, latencies, errors, wall, args.concurrency))
+
+        video_id = f"{size}-warm"
+        client.get('/api/subtitles', video_id=video_id)
+        latencies, errors, wall = run_load(
+            lambda i: client.get('/api/subtitles', video_id=video_id), args.requests, args.concurrency)
+        results.append(summarize('subtitles.warm', size, latencies, errors, wall, args.concurrency))
+
+        latencies, errors, wall = run_load(
+            lambda i: client.get('/api/subtitles', video_id=video_id, pure_text='true'),
+            args.requests, args.concurrency)
+        results.append(summarize('subtitles.pure_text', size, latencies, errors, wall, args.concurrency))
+    return results
+
+
+def bench_whisper(client: Client, args) -> List[Dict]:
+    results = []
+    for size in args.whisper_sizes:
+        latencies, errors, wall = run_load(
+            lambda i: client.get('/api/whisper/subtitles', video_id=f"{size}-whisper{i}", model=BENCH_MODEL),
+            args.whisper_requests, args.concurrency)
+        results.append(summarize('whisper_subtitles', size, latencies, errors, wall, args.concurrency, size))
+    return results
+
+
+def bench_tovideo(args, work_root: str) -> List[Dict]:
+    results = []
+    for size in args.tovideo_sizes:
+        case_dir = os.path.join(work_root, f"tovideo-{size}")
+        os.makedirs(case_dir, exist_ok=True)
+        vtt_file = fakes.make_caption_file(os.path.join(case_dir, 'input.vtt'), size)
+        video_file = fakes.make_test_video(os.path.join(case_dir, 'input.mp4'), size * fakes.CUE_MS / 1000)
+
+        def run(i):
+            work_dir = os.path.join(case_dir, f"work{i}")
+            process = subprocess.run(
+                [sys.executable, os.path.join(ROOT, 'tovideo.py'), '--vtt', vtt_file, '--video', video_file,
+                 '--output', os.path.join(case_dir, f"output{i}.mp4"), '--tts', 'stub', '--no-cache',
+                 '--jobs', str(args.tovideo_jobs), '--work-dir', work_dir, '--clean'],
+                cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            if process.returncode != 0:
+                raise RuntimeError(process.stderr.decode(errors='ignore')[-500:])
+            return True
+
+        latencies, errors, wall = run_load(run, args.tovideo_runs, 1)
+        results.append(summarize('tovideo', size, latencies, errors, wall, 1, size))
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {(r['scenario'], r['size']): r for r in json.load(f)['results']}
+    print(f"\ncompared with {baseline_path}")
+    print(f"{'scenario':<22}{'size':>7}{'p50':>10}{'p99':>10}{'throughput':>12}")
+    for result in results:
+        old = baseline.get((result['scenario'], result['size']))
+        if not old or 'skipped' in result or 'skipped' in old:
+            continue
+
+        def ratio(key):
+            return f"{result[key] / old[key]:.2f}x" if old.get(key) else '-'
+
+        print(f"{result['scenario']:<22}{result['size']:>7}{ratio('p50_ms'):>10}"
+              f"{ratio('p99_ms'):>10}{ratio('throughput_rps'):>12}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    started = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    work_root = tempfile.mkdtemp(prefix='yt-tools-bench-')
+    results: List[Dict] = []
+
+    with fakes.FakeYouTubeServer(latency=args.latency) as server:
+        # 服务模块在导入时读取配置，必须在导入 app.main 之前修改
+        config.YOUTUBE_BASE_URL = server.base_url
+        config.YTDLP_COOKIES_BROWSER = None
+        config.HOST_RATE_LIMIT = 0
+        config.HOST_MAX_CONCURRENCY = max(config.HOST_MAX_CONCURRENCY, args.concurrency)
+        config.CHANNEL_INDEX_PATH = os.path.join(work_root, 'channels.sqlite')
+        config.SUBTITLE_CACHE_STORE = None
+        config.WHISPER_JOB_WORKERS = 0
+        config.WHISPER_JOB_DB_PATH = os.path.join(work_root, 'jobs.sqlite')
+        config.WHISPER_TRANSCRIPT_DB_PATH = os.path.join(work_root, 'transcripts.sqlite')
+        config.WHISPER_PRELOAD_MODELS = ()
+        config.LOG_LEVEL = 'WARNING'
+
+        from app.main import create_app
+        from app.services.model_registry import model_registry
+        from app.services.ydl_pool import ydl_pool
+
+        ydl_pool.factory = fakes.FakeYoutubeDL
+        model_registry.register(BENCH_MODEL, fakes.FakeWhisperModel(args.whisper_rtf))
+        client = Client(create_app())
+
+        try:
+            for name in scenarios:
+                print(f"running {name}...", file=sys.stderr)
+                if name in ('whisper', 'tovideo') and not fakes.have_ffmpeg():
+                    results.append({'scenario': name, 'skipped': 'ffmpeg/ffprobe not found'})
+                elif name == 'channel':
+                    results.extend(bench_channel(client, args))
+                elif name == 'subtitles':
+                    results.extend(bench_subtitles(client, args))
+                elif name == 'whisper':
+                    results.extend(bench_whisper(client, args))
+                elif name == 'tovideo':
+                    results.extend(bench_tovideo(args, work_root))
+        finally:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    print(f"{'scenario':<22}{'size':>7}{'reqs':>6}{'err':>5}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        if 'skipped' in result:
+            print(f"{result['scenario']:<22} skipped: {result['skipped']}")
+            continue
+        print(f"{result['scenario']:<22}{result['size']:>7}{result['requests']:>6}{result['errors']:>5}"
+              f"{result['throughput_rps']:>10.2f}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+
+    report = {
+        'meta': {
+            'started': started,
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
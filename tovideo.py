@@ -1,13 +1,22 @@
 #!/usr/bin/env /opt/anaconda3/envs/py3.12.02/bin/python 
 import argparse
 import asyncio
+import hashlib
+import io
+import json
+import math
 import os
-import webvtt
-from moviepy.editor import VideoFileClip, concatenate_videoclips, AudioFileClip, concatenate_audioclips
-import edge_tts
-from datetime import datetime, timedelta
-from pydub import AudioSegment
+import random
+import struct
+import wave
+import numpy as np
 import shutil
+import sqlite3
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fractions import Fraction
+from app import vtt
 
 # 解析命令行参数
 def parse_args():
@@ -15,178 +24,568 @@ def parse_args():
     parser.add_argument("--vtt", required=True, help="Path to the input VTT subtitle file")
     parser.add_argument("--video", required=True, help="Path to the input video file")
     parser.add_argument("--output", default="output.mp4", help="Path to the output video file")
+    parser.add_argument("--tts", default="edge", choices=sorted(TTS_BACKENDS), help="TTS backend (stub works offline)")
+    parser.add_argument("--voice", default="zh-CN-YunyangNeural", help="TTS voice")
+    parser.add_argument("--rate", default="+0%", help="TTS speaking rate, e.g. +10%%")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of concurrent TTS requests")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per caption when TTS fails")
+    parser.add_argument("--cache-dir", default=os.path.expanduser("~/.cache/yt-tools/tts"),
+                        help="Directory of the persistent TTS audio cache")
+    parser.add_argument("--cache-max-mb", type=int, default=1024, help="Size cap of the TTS cache in MB")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the TTS cache")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Encode the video in this many chunks in parallel (1 renders in a single pass)")
+    parser.add_argument("--work-dir", help="Job work directory (default: dub_jobs/<hash of input and output paths>)")
+    parser.add_argument("--clean", action="store_true", help="Remove the work directory after a successful run")
+    parser.add_argument("--preset", default="medium", help="libx264 preset")
+    parser.add_argument("--crf", type=int, default=23, help="libx264 CRF")
     return parser.parse_args()
 
-# 将 VTT 时间格式（HH:MM:SS.mmm）转换为秒
-def vtt_time_to_seconds(vtt_time):
-    if len(vtt_time.split(':')) <3:
-        vtt_time = '00:' + vtt_time
-    dt = datetime.strptime(vtt_time.split('.')[0], '%H:%M:%S')
-    milliseconds = int(vtt_time.split('.')[1])
-    return dt.hour * 3600 + dt.minute * 60 + dt.second + milliseconds / 1000
-
-# 将秒转换为 VTT 时间格式
-def seconds_to_vtt_time(seconds):
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    milliseconds = int((seconds % 1) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{milliseconds:03d}"
-
-# 使用 edge-tts 生成音频并返回音频时长
-# async def generate_audio(text, output_audio, voice="zh-CN-XiaoxiaoNeural"):
-async def generate_audio(text, output_audio, voice="zh-CN-YunyangNeural"):
-    communicate = edge_tts.Communicate(text, voice)
-    await communicate.save(output_audio)
-    audio_clip = AudioFileClip(output_audio)
-    duration = audio_clip.duration
-    audio_clip.close()
-    return duration
+# 读取 UTF-8 文本文件（兼容带 BOM 的字幕）
+def read_text(path):
+    with open(path, encoding='utf-8-sig') as f:
+        return f.read()
+
+# 配音时间轴的采样率（与 edge-tts 输出一致）
+TIMELINE_SAMPLE_RATE = 24000
+
+# MPEG Layer III 比特率表（kbps），分别对应 MPEG-1 和 MPEG-2/2.5
+MP3_BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# 通过遍历 MP3 帧头计算时长，无需解码
+def mp3_duration(data):
+    pos = 0
+    if data[:3] == b'ID3':
+        size = data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]
+        pos = 10 + size
+
+    samples = 0
+    sample_rate = None
+    while pos + 4 <= len(data):
+        header = struct.unpack('>I', data[pos:pos + 4])[0]
+        version = (header >> 19) & 3
+        layer = (header >> 17) & 3
+        bitrate_index = (header >> 12) & 0xF
+        rate_index = (header >> 10) & 3
+        if ((header & 0xFFE00000) != 0xFFE00000 or version == 1 or layer != 1
+                or bitrate_index in (0, 15) or rate_index == 3):
+            pos += 1
+            continue
+        padding = (header >> 9) & 1
+        bitrate = MP3_BITRATES[3 if version == 3 else 2][bitrate_index] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+        frame_samples = 1152 if version == 3 else 576
+        samples += frame_samples
+        pos += frame_samples // 8 * bitrate // sample_rate + padding
+    return samples / sample_rate if sample_rate else 0.0
+
+# 从合成的音频字节中读取时长（WAV 或 MP3）
+def audio_duration(data):
+    if data[:4] == b'RIFF':
+        with wave.open(io.BytesIO(data)) as wav:
+            return wav.getnframes() / wav.getframerate()
+    return mp3_duration(data)
+
+# 使用 edge-tts 合成语音
+class EdgeTTSBackend:
+    name = "edge"
+    ext = "mp3"
+
+    def __init__(self, voice="zh-CN-YunyangNeural", rate="+0%"):
+        self.voice = voice
+        self.rate = rate
+
+    async def synthesize(self, text):
+        import edge_tts
+
+        communicate = edge_tts.Communicate(text, self.voice, rate=self.rate)
+        chunks = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                chunks.append(chunk["data"])
+        return b"".join(chunks)
+
+# 离线使用的占位 TTS：生成长度与文本长度成正比的正弦音
+class StubTTSBackend:
+    name = "stub"
+    ext = "wav"
+    sample_rate = 24000
+
+    def __init__(self, voice="stub", rate="+0%", seconds_per_char=0.15):
+        self.voice = voice
+        self.rate = rate
+        self.seconds_per_char = seconds_per_char
+
+    async def synthesize(self, text):
+        frames = int(max(0.3, len(text) * self.seconds_per_char) * self.sample_rate)
+        tone = b"".join(
+            struct.pack('<h', int(8000 * math.sin(2 * math.pi * 440 * i / self.sample_rate)))
+            for i in range(self.sample_rate // 10)
+        )
+        pcm = (tone * (frames // (self.sample_rate // 10) + 1))[:frames * 2]
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(pcm)
+        return buffer.getvalue()
+
+TTS_BACKENDS = {
+    EdgeTTSBackend.name: EdgeTTSBackend,
+    StubTTSBackend.name: StubTTSBackend,
+}
+
+# 按 (文本, 语音, 语速) 缓存合成的音频及其时长，超出容量时淘汰最久未使用的条目
+class TTSCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        # 多个配音任务可以同时使用同一个缓存目录
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL, "
+            "duration REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(backend, text):
+        params = json.dumps([backend.name, backend.voice, backend.rate, text], ensure_ascii=False)
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        row = self.conn.execute("SELECT filename, duration FROM entries WHERE key = ?", (key,)).fetchone()
+        if row:
+            try:
+                with open(os.path.join(self.cache_dir, row[0]), "rb") as f:
+                    data = f.read()
+            except OSError:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.conn.commit()
+            else:
+                self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+                self.hits += 1
+                return data, row[1]
+        self.misses += 1
+        return None
+
+    def put(self, key, data, duration, ext):
+        filename = f"{key}.{ext}"
+        path = os.path.join(self.cache_dir, filename)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, filename, size, duration, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, filename, len(data), duration, time.time())
+        )
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, filename, size in self.conn.execute(
+                "SELECT key, filename, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, filename))
+            except OSError:
+                pass
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+        self.conn.commit()
+
+    def stats(self):
+        return f"TTS cache: {self.hits} hits, {self.misses} misses"
+
+    def close(self):
+        self.conn.close()
+
+# 记录每个任务的中间产物（每条字幕的语音、每个视频块）及其输入哈希，重新运行时复用未变化的部分
+class RenderManifest:
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {"version": self.version, "cues": {}, "chunks": {}}
+        self._saved_at = 0.0
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == self.version:
+                    self.data = data
+            except (OSError, ValueError):
+                print(f"Warning: ignoring unreadable manifest {path}")
+
+    @staticmethod
+    def hash(*parts):
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def cue(self, index):
+        return self.data["cues"].get(str(index))
+
+    def set_cue(self, index, entry):
+        self.data["cues"][str(index)] = entry
+
+    def chunk(self, key):
+        return self.data["chunks"].get(key)
+
+    def set_chunk(self, key, entry):
+        self.data["chunks"][key] = entry
+
+    def save(self, force=False):
+        # 合成过程中每条字幕完成都会调用，限制写盘频率
+        now = time.monotonic()
+        if not force and now - self._saved_at < 1.0:
+            return
+        self._saved_at = now
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(self.path + ".tmp", self.path)
+
+# 源视频的标识：路径、大小和修改时间
+def source_identity(video_file):
+    stat = os.stat(video_file)
+    return [os.path.abspath(video_file), stat.st_size, stat.st_mtime_ns]
+
+# 合成一条字幕的语音，失败时指数退避重试
+async def synthesize_with_retry(backend, text, semaphore, retries=3, backoff=1.0):
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                data = await backend.synthesize(text)
+            if not data:
+                raise RuntimeError("TTS returned no audio")
+            return data
+        except Exception as e:
+            if attempt == retries:
+                raise RuntimeError(f"TTS failed for {text!r}: {e}") from e
+            delay = backoff * 2 ** attempt * (1 + random.random())
+            print(f"TTS attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+# 把一段语音解码为单声道 16 位 PCM；采样格式一致的 WAV 直接读取，其他格式经 ffmpeg 管道解码
+def decode_pcm(audio_file, sample_rate=TIMELINE_SAMPLE_RATE):
+    with open(audio_file, 'rb') as f:
+        header = f.read(4)
+    if header == b'RIFF':
+        with wave.open(audio_file) as wav:
+            if (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) == (1, 2, sample_rate):
+                return np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", audio_file,
+         "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "-"],
+        capture_output=True, check=True
+    )
+    return np.frombuffer(result.stdout, dtype='<i2')
+
+# 在按最终长度预分配的 PCM 缓冲区中放置每段语音，静音部分保持为零，最后只写出一次
+def build_audio_timeline(timeline, total_duration, output_file, sample_rate=TIMELINE_SAMPLE_RATE):
+    buffer = np.zeros(int(round(total_duration * sample_rate)), dtype='<i2')
+    audio_files = [audio_file for audio_file, _, _ in timeline]
+
+    # 每段语音只解码一次，多个 ffmpeg 进程并行；分批提交，同时驻留的解码结果有限
+    workers = os.cpu_count() or 4
+    batch = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch_start in range(0, len(timeline), batch):
+            entries = timeline[batch_start:batch_start + batch]
+            for (_, offset, slot), pcm in zip(entries, executor.map(decode_pcm, audio_files[batch_start:batch_start + batch])):
+                start = int(round(offset * sample_rate))
+                length = min(len(pcm), int(round(slot * sample_rate)), len(buffer) - start)
+                if length > 0:
+                    buffer[start:start + length] = pcm[:length]
+
+    with wave.open(output_file, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(buffer.tobytes())
+    return output_file
 
 # 处理 VTT 文件，生成音频和新的 VTT 文件
-async def process_vtt(vtt_file, output_audio_dir, output_vtt):
-    vtt = webvtt.read(vtt_file)
-    new_captions = []
-    audio_files = []
-    total_duration = 0
+async def process_vtt(vtt_file, output_audio_dir, output_vtt, backend, concurrency=8, retries=3, cache=None,
+                      manifest=None):
+    # 去掉行内样式标签，只把可读文本交给 TTS
+    captions = [(start, end, vtt.strip_tags(text)) for start, end, text in vtt.parse_vtt(read_text(vtt_file))]
+    semaphore = asyncio.Semaphore(concurrency)
 
     if not os.path.exists(output_audio_dir):
         os.makedirs(output_audio_dir)
 
-    for i, caption in enumerate(vtt):
-        text = caption.text
-        audio_file = os.path.join(output_audio_dir, f"segment_{i}.mp3")
-        duration = await generate_audio(text, audio_file)
-        start_time = seconds_to_vtt_time(total_duration)
-        end_time = seconds_to_vtt_time(total_duration + duration)
-        new_captions.append({
-            'start': start_time,
-            'end': end_time,
-            'text': text
-        })
-        audio_files.append(audio_file)
-        total_duration += duration
+    async def synthesize_text(text):
+        key = TTSCache.make_key(backend, text)
+        cached = cache.get(key) if cache else None
+        if cached:
+            return cached
+        data = await synthesize_with_retry(backend, text, semaphore, retries)
+        duration = audio_duration(data)
+        if cache:
+            cache.put(key, data, duration, backend.ext)
+        return data, duration
+
+    # 相同文本在一次运行中只合成一次
+    syntheses = {}
+
+    async def synthesize_caption(i, caption):
+        start, end, text = caption
+        audio_file = os.path.join(output_audio_dir, f"segment_{i}.{backend.ext}")
+        tts_key = TTSCache.make_key(backend, text)
+
+        # 上次运行已生成且文本和语音参数未变的字幕直接复用
+        entry = manifest.cue(i) if manifest else None
+        if entry and entry["tts_key"] == tts_key and entry["status"] == "done" and os.path.exists(audio_file):
+            return audio_file, entry["duration"]
 
-        # Calculate VTT duration
-        vtt_duration = vtt_time_to_seconds(caption.end) - vtt_time_to_seconds(caption.start)
+        if text not in syntheses:
+            syntheses[text] = asyncio.ensure_future(synthesize_text(text))
+        data, duration = await syntheses[text]
 
-        # Add silence if the audio duration is less than the VTT duration
-        if duration < vtt_duration:
-            silence_duration = vtt_duration - duration
-            # Generate silence dynamically using pydub
-            silence = AudioSegment.silent(duration=silence_duration * 1000)  # duration in milliseconds
-            audio_clip = AudioSegment.from_file(audio_file)
-            audio_clip = audio_clip + silence
-            audio_clip.export(audio_file, format="mp3")
-            duration = vtt_duration
+        with open(audio_file, 'wb') as f:
+            f.write(data)
+        if manifest:
+            manifest.set_cue(i, {
+                "tts_key": tts_key,
+                "start": vtt.format_timestamp(start),
+                "end": vtt.format_timestamp(end),
+                "audio": audio_file,
+                "duration": duration,
+                "status": "done",
+            })
+            manifest.save()
+        return audio_file, duration
+
+    # 并发合成所有字幕的语音，结果按字幕顺序返回
+    try:
+        results = await asyncio.gather(*(synthesize_caption(i, caption) for i, caption in enumerate(captions)))
+    finally:
+        if manifest:
+            manifest.save(force=True)
+
+    # 按字幕顺序计算新的时间轴，保证输出确定
+    new_captions = []
+    audio_files = []
+    timeline = []
+    total_duration = 0
+    for (start, end, text), (audio_file, duration) in zip(captions, results):
+        if duration == 0:
+            print(f"Warning: audio for caption {vtt.format_timestamp(start)} is empty.")
+
+        # 语音短于原字幕时长时，用静音补齐到原时长
+        vtt_duration = (end - start) / 1000
+        slot = max(duration, vtt_duration)
+
+        new_captions.append((int(total_duration * 1000), int((total_duration + slot) * 1000), text))
+        audio_files.append(audio_file)
+        timeline.append((audio_file, total_duration, slot))
+        total_duration += slot
 
     # 写入新的 VTT 文件
     with open(output_vtt, 'w', encoding='utf-8') as f:
-        f.write("WEBVTT\n\n")
-        for caption in new_captions:
-            f.write(f"{caption['start']} --> {caption['end']}\n{caption['text']}\n\n")
+        f.write(vtt.to_vtt(vtt.Cues.from_tuples(new_captions)))
 
     # 合并音频
-    audio_clips = [AudioSegment.from_file(af) for af in audio_files]
-    final_audio = sum(audio_clips)
-    final_audio.export(os.path.join(output_audio_dir, "final_audio.mp3"), format="mp3")
-
-    # Debugging: Check audio clip durations
-    for i, audio_clip in enumerate(audio_clips):
-        print(f"Audio clip {i} duration: {audio_clip.duration_seconds} seconds")
-        if audio_clip.duration_seconds == 0:
-            print(f"Warning: Audio clip {i} is empty.")
+    build_audio_timeline(timeline, total_duration, os.path.join(output_audio_dir, "final_audio.wav"))
 
     return audio_files, total_duration
 
-# 分割视频并根据新 VTT 调整长度
-def process_video(video_file, vtt_file, new_vtt_file, output_dir):
-    vtt = webvtt.read(vtt_file)
-    new_vtt = webvtt.read(new_vtt_file)
-    video = VideoFileClip(video_file)
-    video_segments = []
-    video_duration = video.duration
-
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+# 读取视频时长和帧率
+def probe_video(video_file):
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=r_frame_rate:format=duration", "-of", "json", video_file],
+        capture_output=True, check=True
+    )
+    info = json.loads(result.stdout)
+    # 帧率保留 ffprobe 给出的分数形式（如 30000/1001），避免取整误差
+    return float(info["format"]["duration"]), info["streams"][0]["r_frame_rate"]
 
-    for i, (old_caption, new_caption) in enumerate(zip(vtt, new_vtt)):
-        old_start = vtt_time_to_seconds(old_caption.start)
-        old_end = vtt_time_to_seconds(old_caption.end)
+# 根据原 VTT 和新 VTT 计算每个视频片段的截取范围和目标时长
+# 音频时间轴包含每条字幕，视频也必须为每条字幕生成一个片段，否则两者逐渐错位：
+# 超出视频末尾的字幕定格在最后一帧，过短的字幕至少截取一帧
+def plan_segments(vtt_file, new_vtt_file, video_duration, fps):
+    frame = float(1 / Fraction(fps))
+    last_frame = max(video_duration - frame, 0.0)
+    segments = []
+    old_cues = vtt.parse_vtt(read_text(vtt_file))
+    new_cues = vtt.parse_vtt(read_text(new_vtt_file))
+    for (old_start, old_end, _), (new_start, new_end, _) in zip(old_cues, new_cues):
+        old_start /= 1000
+        old_end /= 1000
+        new_duration = (new_end - new_start) / 1000
 
-        # Ensure old_start and old_end are within the video duration
-        if old_start >= video_duration:
-            print(f"Warning: old_start ({old_start}) is beyond video duration ({video_duration}). Skipping segment.")
+        # 音频时间轴中长度为零的字幕在视频中也不占时长
+        if new_duration <= 0:
             continue
-        if old_end > video_duration:
-            print(f"Warning: old_end ({old_end}) is beyond video duration ({video_duration}). Adjusting to video duration.")
-            old_end = video_duration
-
-        new_start = vtt_time_to_seconds(new_caption.start)
-        new_end = vtt_time_to_seconds(new_caption.end)
-
-        # 裁剪视频片段
-        segment = video.subclip(old_start, old_end)
-        old_duration = old_end - old_start
-        new_duration = new_end - new_start
-
-        # 调整速度以匹配新时长
-        speed_factor = old_duration / new_duration
-        segment = segment.speedx(factor=speed_factor)
-
-        # 保存临时视频片段
-        segment_file = os.path.join(output_dir, f"video_segment_{i}.mp4")
-        segment.write_videofile(segment_file, codec="libx264", audio_codec="aac")
-        video_segments.append(segment_file)
-        segment.close()
-
-    video.close()
-    return video_segments
-
-# 合并视频和音频
-def merge_video_audio(video_segments, audio_file, output_file):
-    clips = [VideoFileClip(vs) for vs in video_segments]
-    final_video = concatenate_videoclips(clips)
-    audio = AudioFileClip(audio_file)
-    final_video = final_video.set_audio(audio)
-    final_video.write_videofile(output_file, codec="libx264", audio_codec="aac")
-    final_video.close()
-    audio.close()
-    for clip in clips:
-        clip.close()
+        if old_start >= last_frame:
+            print(f"Warning: cue at {old_start:.3f}s is beyond the video ({video_duration:.3f}s). Holding the last frame.")
+            old_start = last_frame
+        old_end = min(max(old_end, old_start + frame), video_duration)
+
+        segments.append((old_start, old_end, new_duration))
+    return segments
+
+# 生成 ffmpeg 滤镜图：每个片段 trim 后用 setpts 调整速度，再拼接为一路视频
+def build_filter_graph(segments, fps, offset=0.0):
+    count = len(segments)
+    parts = ["[0:v]split=%d%s" % (count, "".join(f"[s{i}]" for i in range(count)))]
+    for i, (start, end, new_duration) in enumerate(segments):
+        factor = new_duration / (end - start)
+        parts.append(
+            f"[s{i}]trim=start={start - offset:.3f}:end={end - offset:.3f},"
+            f"setpts=(PTS-STARTPTS)*{factor:.6f}[v{i}]"
+        )
+    parts.append("".join(f"[v{i}]" for i in range(count)) + f"concat=n={count}:v=1:a=0,fps={fps}[vout]")
+    return ";\n".join(parts)
+
+def write_filter_script(graph, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(graph)
+    return path
+
+def x264_args(preset, crf, threads=0):
+    return ["-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p", "-threads", str(threads)]
+
+# 单次编码：一个滤镜图完成全部片段的裁剪、变速和拼接，并直接混入音频
+def render_single_pass(video_file, segments, audio_file, output_file, fps, work_dir, preset="medium", crf=23):
+    script = write_filter_script(build_filter_graph(segments, fps), os.path.join(work_dir, "filter_graph.txt"))
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", "-i", video_file, "-i", audio_file,
+         "-filter_complex_script", script, "-map", "[vout]", "-map", "1:a",
+         *x264_args(preset, crf), "-c:a", "aac", "-shortest", output_file],
+        check=True
+    )
+
+# 按源视频时长把片段分成若干连续的块
+def split_segments(segments, chunks):
+    total = sum(end - start for start, end, _ in segments)
+    target = total / chunks
+    groups = [[]]
+    acc = 0.0
+    for segment in segments:
+        if groups[-1] and acc >= target * len(groups) and len(groups) < chunks:
+            groups.append([])
+        groups[-1].append(segment)
+        acc += segment[1] - segment[0]
+    return groups
+
+def render_chunk(video_file, segments, fps, chunk_file, script_file, preset, crf, threads):
+    # 字幕时间可能重叠或乱序，首尾字幕不一定是块的起止
+    start = min(s[0] for s in segments)
+    end = max(s[1] for s in segments)
+    write_filter_script(build_filter_graph(segments, fps, offset=start), script_file)
+    # -ss 放在 -i 之前只解码该块所需的部分，每块从关键帧开始独立编码
+    # 先写入临时文件，中断时不会留下看似完整的块
+    partial_file = chunk_file + ".partial.mp4"
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", video_file,
+         "-filter_complex_script", script_file, "-map", "[vout]", "-an",
+         *x264_args(preset, crf, threads), partial_file],
+        check=True
+    )
+    os.replace(partial_file, chunk_file)
+    return chunk_file
+
+# 并行编码：各块由独立的 ffmpeg 进程编码，再以流复制方式拼接并混入音频
+# 块按输入哈希命名，manifest 中已完成且输入未变的块直接复用
+def render_chunked(video_file, segments, audio_file, output_file, fps, work_dir, jobs, preset="medium", crf=23,
+                   manifest=None):
+    groups = split_segments(segments, jobs)
+    threads = max(1, (os.cpu_count() or jobs) // len(groups))
+    source = source_identity(video_file)
+
+    chunk_files = []
+    pending = {}
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        for group in groups:
+            key = RenderManifest.hash(source, group, fps, preset, crf)
+            chunk_file = os.path.join(work_dir, f"chunk_{key[:16]}.mp4")
+            chunk_files.append(chunk_file)
+            entry = manifest.chunk(key) if manifest else None
+            if entry and entry["status"] == "done" and os.path.exists(chunk_file):
+                continue
+            future = executor.submit(render_chunk, video_file, group, fps, chunk_file,
+                                     os.path.join(work_dir, f"chunk_{key[:16]}_graph.txt"),
+                                     preset, crf, threads)
+            pending[future] = key
+
+        print(f"Rendering {len(pending)} of {len(groups)} video chunks")
+        try:
+            for future in as_completed(pending):
+                chunk_file = future.result()
+                if manifest:
+                    manifest.set_chunk(pending[future], {"video": chunk_file, "status": "done"})
+                    manifest.save(force=True)
+        except Exception:
+            for future in pending:
+                future.cancel()
+            raise
+
+    concat_list = os.path.join(work_dir, "chunks.txt")
+    with open(concat_list, "w", encoding="utf-8") as f:
+        for chunk_file in chunk_files:
+            f.write(f"file '{os.path.abspath(chunk_file)}'\n")
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", concat_list, "-i", audio_file,
+         "-map", "0:v", "-map", "1:a", "-c:v", "copy", "-c:a", "aac", "-shortest", output_file],
+        check=True
+    )
+    return chunk_files
 
 # 主函数
 async def main():
     args = parse_args()
-    output_audio_dir = "temp_audio"
-    output_video_dir = "temp_video"
-    new_vtt_file = "adjusted.vtt"
-    final_audio_file = os.path.join(output_audio_dir, "final_audio.mp3")
+
+    # 每个任务使用独立的工作目录，中断后重新运行可复用其中的中间产物
+    job_id = RenderManifest.hash(os.path.abspath(args.video), os.path.abspath(args.vtt),
+                                 os.path.abspath(args.output))[:16]
+    work_dir = args.work_dir or os.path.join("dub_jobs", job_id)
+    output_audio_dir = os.path.join(work_dir, "audio")
+    output_video_dir = os.path.join(work_dir, "video")
+    new_vtt_file = os.path.join(work_dir, "adjusted.vtt")
+    final_audio_file = os.path.join(output_audio_dir, "final_audio.wav")
+    os.makedirs(output_video_dir, exist_ok=True)
+    manifest = RenderManifest(os.path.join(work_dir, "manifest.json"))
+    print(f"Work directory: {work_dir}")
 
     # 处理 VTT 和生成音频
-    audio_files, _ = await process_vtt(args.vtt, output_audio_dir, new_vtt_file)
-
-    # 分割视频并调整长度
-    video_segments = process_video(args.video, args.vtt, new_vtt_file, output_video_dir)
-
-    # 合并视频和音频
-    merge_video_audio(video_segments, final_audio_file, args.output)
-
-    # 清理临时文件
-    for af in audio_files:
-        if os.path.exists(af):
-            os.remove(af)
-    for vs in video_segments:
-        if os.path.exists(vs):
-            os.remove(vs)
-    if os.path.exists(final_audio_file):
-        os.remove(final_audio_file)
-    if os.path.exists(new_vtt_file):
-        os.remove(new_vtt_file)
-    if os.path.exists(output_audio_dir):
-        shutil.rmtree(output_audio_dir)
-    if os.path.exists(output_video_dir):
-        shutil.rmtree(output_video_dir)
+    backend = TTS_BACKENDS[args.tts](voice=args.voice, rate=args.rate)
+    cache = None if args.no_cache else TTSCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    try:
+        await process_vtt(args.vtt, output_audio_dir, new_vtt_file, backend,
+                          concurrency=args.concurrency, retries=args.retries, cache=cache, manifest=manifest)
+    finally:
+        if cache:
+            print(cache.stats())
+            cache.close()
+
+    # 按新字幕时长调整视频片段并与音频合并，只编码一次
+    video_duration, fps = probe_video(args.video)
+    segments = plan_segments(args.vtt, new_vtt_file, video_duration, fps)
+    if args.jobs > 1:
+        render_chunked(args.video, segments, final_audio_file, args.output, fps, output_video_dir,
+                       args.jobs, args.preset, args.crf, manifest=manifest)
+    else:
+        render_single_pass(args.video, segments, final_audio_file, args.output, fps, output_video_dir,
+                           args.preset, args.crf)
+
+    # 成功后按需清理工作目录；失败时保留，以便重新运行时续做
+    if args.clean:
+        shutil.rmtree(work_dir)
 
 if __name__ == "__main__":
     asyncio.run(main())